@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: the original groupby/apply + per-place query emoji helpers
+from something.py against the vectorized ones in flaskapp/emoji_stats.py.
+
+    python experimentation/bench_emoji_stats.py --rows 2500 100000 1000000
+
+The legacy path is skipped above --legacy-max-rows because its per-place
+queries make it impractically slow on large tables.
+
+The second table compares a plain frame (object keys, int64 counts, city
+selected with a boolean mask) against a compact EmojiTable (categorical
+keys, uint16 counts, zero-copy city slices) on --table-rows rows of
+synthetic data: memory, and slice + stats time per city.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "flaskapp"))
+
+from emoji_stats import compute_emoji4_ratio, top_places_with_counts  # noqa: E402
+from emoji_table import EmojiTable  # noqa: E402
+from userInput import generate_synthetic_tourist_data  # noqa: E402
+
+
+def random_emoji_table(rows: int, places_per_neighbourhood: int = 5, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    neighbourhoods = max(1, rows // places_per_neighbourhood)
+    nbh_ids = np.repeat(np.arange(neighbourhoods), places_per_neighbourhood)[:rows]
+    df = pd.DataFrame({
+        "neighbourhood": pd.Index([f"Hood {i}" for i in range(neighbourhoods)])[nbh_ids],
+        "place": [f"Place {i}" for i in range(rows)],
+    })
+    for e in range(1, 6):
+        df[f"emoji_{e}"] = rng.integers(0, 101, rows)
+    return df
+
+
+# --- original helpers from generate_neighbourhood_safety_json -------------
+def legacy_emoji4_ratio(df):
+    df = df.copy()
+    df["total"] = df.filter(like="emoji_").sum(axis=1)
+    df["ratio"] = df["emoji_4"] / df["total"].clip(lower=1)
+    return (
+        df.groupby("neighbourhood")
+          .apply(lambda g: (g["ratio"] * g["total"]).sum() / g["total"].sum())
+    )
+
+
+def legacy_top_places_counts(df, n=3):
+    top_places = (
+        df.sort_values("emoji_4", ascending=False)
+          .groupby("neighbourhood")
+          .head(n)
+          .groupby("neighbourhood")["place"]
+          .apply(list)
+          .to_dict()
+    )
+    result = {}
+    for nbh, places in top_places.items():
+        result[nbh] = []
+        for p in places:
+            count = df.query("neighbourhood == @nbh and place == @p")["emoji_4"].iloc[0]
+            result[nbh].append({"place": p, "emoji4": int(count)})
+    return result
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[2_500, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max-rows", type=int, default=5_000)
+    parser.add_argument("--table-rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--cities", type=int, default=20, help="cities timed per table")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for rows in args.rows:
+        df = random_emoji_table(rows)
+        new_time, (new_ratio, new_top) = timed(
+            lambda d: (compute_emoji4_ratio(d), top_places_with_counts(d)), df
+        )
+        if rows <= args.legacy_max_rows:
+            old_time, (old_ratio, old_top) = timed(
+                lambda d: (legacy_emoji4_ratio(d), legacy_top_places_counts(d)), df, repeat=1
+            )
+            assert np.allclose(old_ratio.sort_index(), new_ratio.sort_index())
+            assert {k: sorted(p["emoji4"] for p in v) for k, v in old_top.items()} == \
+                   {k: sorted(p["emoji4"] for p in v) for k, v in new_top.items()}
+            print(f"{rows:>10} {old_time:>12.3f} {new_time:>15.4f} {old_time / new_time:>7.0f}x")
+        else:
+            print(f"{rows:>10} {'-':>12} {new_time:>15.4f} {'-':>8}")
+
+    print()
+    print(f"{'rows':>10} {'plain MB':>9} {'compact MB':>11} {'plain ms/city':>14} "
+          f"{'compact ms/city':>16} {'speedup':>8}")
+    for rows in args.table_rows:
+        compact_df = generate_synthetic_tourist_data(
+            num_cities=max(1, rows // 5_000), neighborhoods_per_city=50,
+            places_per_neighborhood=100, vectorized=True,
+        )
+        plain = compact_df.astype({c: object for c in ("city", "neighbourhood", "place")})
+        plain = plain.astype({c: np.int64 for c in plain.columns if c.startswith("emoji_")})
+        table = EmojiTable.from_frame(compact_df)
+        del compact_df
+        cities = table.cities()[:args.cities]
+
+        def plain_stats():
+            for city in cities:
+                city_df = plain[plain["city"] == city]
+                compute_emoji4_ratio(city_df), top_places_with_counts(city_df)
+
+        def compact_stats():
+            for city in cities:
+                city_df = table.city_slice(city)
+                compute_emoji4_ratio(city_df), top_places_with_counts(city_df)
+
+        plain_time, _ = timed(plain_stats, repeat=1)
+        compact_time, _ = timed(compact_stats, repeat=1)
+        for city in cities[:3]:
+            a, b = plain[plain["city"] == city], table.city_slice(city)
+            assert np.allclose(compute_emoji4_ratio(a), compute_emoji4_ratio(b))
+            assert top_places_with_counts(a) == top_places_with_counts(b)
+        plain_mb = plain.memory_usage(deep=True).sum() / 2 ** 20
+        print(f"{len(table):>10} {plain_mb:>9.0f} {table.memory_usage() / 2 ** 20:>11.1f} "
+              f"{plain_time / len(cities) * 1000:>14.1f} {compact_time / len(cities) * 1000:>16.1f} "
+              f"{plain_time / compact_time:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
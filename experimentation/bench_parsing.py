@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: the original HoodMaps regex and feedparser/BeautifulSoup/
+strptime RSS handling against flaskapp/parsing.py, on the saved pages in
+experimentation/fixtures/.
+
+    python experimentation/bench_parsing.py --repeat 200
+
+The summary cleanup is also timed on its own, on the same feedparser
+entries for both paths.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import feedparser
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "flaskapp"))
+
+from city_processor import summaries_from_feed  # noqa: E402
+from parsing import find_hoodmaps_payload, strip_tags  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+# --- original code from city_processor.py ---------------------------------
+def legacy_hoodmaps_payload(html, prefix):
+    pattern = rf"<em[^>]*>\s*{re.escape(prefix)}\s*(.+?)</em>"
+    match = re.search(pattern, html, flags=re.DOTALL | re.IGNORECASE)
+    return match.group(1).strip() if match else None
+
+
+def legacy_summaries(entries):
+    summaries = []
+    for i, entry in enumerate(entries):
+        if i >= 15:
+            break
+        datetime.strptime(entry.published, "%a, %d %b %Y %H:%M:%S %Z")
+        text = entry.summary if 'summary' in entry else "No summary available"
+        summaries.append(BeautifulSoup(text, "html.parser").get_text())
+    return summaries
+
+
+def legacy_summaries_from_feed(content):
+    return legacy_summaries(feedparser.parse(content).entries)
+
+
+def fast_summaries(entries):
+    summaries = []
+    for i, entry in enumerate(entries):
+        if i >= 15:
+            break
+        text = entry.summary if 'summary' in entry else "No summary available"
+        summaries.append(strip_tags(text))
+    return summaries
+
+
+def timed(fn, *args, repeat=3):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+    return (time.perf_counter() - started) / repeat, result
+
+
+def row(label, old, new):
+    print(f"{label:<28} {old * 1000:>10.3f} {new * 1000:>10.3f} {old / new:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURES, "hoodmaps_amsterdam.html"), encoding="utf-8") as f:
+        html = f.read()
+    with open(os.path.join(FIXTURES, "google_news_rss.xml"), "rb") as f:
+        rss = f.read()
+
+    prefix = "Amsterdam Neighborhood Map:"
+    old_hm, old_payload = timed(legacy_hoodmaps_payload, html, prefix, repeat=args.repeat)
+    new_hm, new_payload = timed(find_hoodmaps_payload, html, prefix, repeat=args.repeat)
+    assert old_payload == new_payload
+
+    entries = feedparser.parse(rss).entries
+    old_clean, old_summaries = timed(legacy_summaries, entries, repeat=args.repeat)
+    new_clean, new_summaries = timed(fast_summaries, entries, repeat=args.repeat)
+    assert old_summaries == new_summaries
+    old_feed, old_summaries = timed(legacy_summaries_from_feed, rss, repeat=max(1, args.repeat // 10))
+    new_feed, new_summaries = timed(summaries_from_feed, rss, repeat=args.repeat)
+    assert old_summaries == new_summaries
+
+    print(f"{'per call':<28} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}")
+    row("hoodmaps <em> scan", old_hm, new_hm)
+    row("rss cleanup (15 entries)", old_clean, new_clean)
+    row("rss parse + cleanup", old_feed, new_feed)
+
+
+if __name__ == "__main__":
+    main()
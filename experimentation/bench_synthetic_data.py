@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Times the vectorized synthetic data generator in flaskapp/userInput.py
+against the original row-by-row Faker one, and streams a large table to
+disk with bounded memory.
+
+    python experimentation/bench_synthetic_data.py --rows 10000000 --out /tmp/emoji.parquet
+
+--rows is rounded to whole cities of --neighbourhoods x --places rows.
+Use a .csv path for CSV output (much slower to write than Parquet).
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "flaskapp"))
+
+from userInput import (  # noqa: E402
+    generate_synthetic_tourist_data,
+    iter_synthetic_chunks,
+    write_synthetic_data,
+)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--neighbourhoods", type=int, default=50)
+    parser.add_argument("--places", type=int, default=100)
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000)
+    parser.add_argument("--out", help="also stream the table to this .parquet/.csv file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    legacy = generate_synthetic_tourist_data()
+    legacy_time = time.perf_counter() - started
+    started = time.perf_counter()
+    generate_synthetic_tourist_data(vectorized=True)
+    fast_time = time.perf_counter() - started
+    print(f"default table ({len(legacy)} rows): faker {legacy_time:.2f}s, vectorized {fast_time:.2f}s")
+
+    per_city = args.neighbourhoods * args.places
+    cities = max(1, args.rows // per_city)
+    kwargs = dict(neighborhoods_per_city=args.neighbourhoods,
+                  places_per_neighborhood=args.places, chunk_rows=args.chunk_rows)
+
+    started = time.perf_counter()
+    rows = 0
+    for frame in iter_synthetic_chunks(cities, **kwargs):
+        rows += len(frame)
+    elapsed = time.perf_counter() - started
+    print(f"generate {rows:,} rows: {elapsed:.2f}s ({rows / elapsed / 1e6:.1f}M rows/s), "
+          f"peak RSS {peak_rss_mb():.0f} MB")
+
+    if args.out:
+        started = time.perf_counter()
+        rows = write_synthetic_data(args.out, cities, **kwargs)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(args.out) / 2 ** 20
+        print(f"write {rows:,} rows to {args.out}: {elapsed:.2f}s, {size:.0f} MB, "
+              f"peak RSS {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
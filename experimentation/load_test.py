@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test: the sync Flask server (main.py) against the async ASGI app
+(asgi.py), with HoodMaps, Google News, the LLM endpoint and httpbin all
+replaced by local stub servers.
+
+    pip install uvicorn
+    python experimentation/load_test.py --clients 32 --duration 15
+
+The sync server gets a fixed number of worker threads (--sync-threads),
+like a gthread WSGI worker; the async server runs on a single event loop.
+Caches (HTTP, LLM responses, per-neighbourhood assessments) and the sync
+app's single-flight coalescing are disabled, so every request on either
+server runs the whole pipeline.
+"""
+import argparse
+import logging
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "flaskapp"))
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+
+import city_processor  # noqa: E402
+import main  # noqa: E402
+import pipeline  # noqa: E402
+import something  # noqa: E402
+from stub_servers import echo_stub, hoodmaps_stub, llm_stub, rss_stub  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_sync_server(threads: int):
+    from werkzeug.serving import BaseWSGIServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    class PooledWSGIServer(BaseWSGIServer):
+        # Serves requests on a fixed-size thread pool
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._work, request, client_address)
+
+        def _work(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer("127.0.0.1", _free_port(), main.app)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def start_async_server():
+    import uvicorn
+    import asgi
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(asgi.app, host="127.0.0.1", port=port,
+                                           log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return f"http://127.0.0.1:{port}", stop
+
+
+def run_load(base_url: str, clients: int, duration: float, city: str):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client_loop():
+        nonlocal errors
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                resp = session.post(f"{base_url}/process_city", json={"city": city}, timeout=120)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for _ in range(clients):
+            pool.submit(client_loop)
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def report(label, latencies, errors, elapsed):
+    if not latencies:
+        print(f"{label:>6}: no successful requests ({errors} errors)")
+        return
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"{label:>6}: {len(latencies) / elapsed:7.2f} req/s  "
+          f"p50 {q[49]:6.2f}s  p95 {q[94]:6.2f}s  ok {len(latencies)}  errors {errors}")
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--sync-threads", type=int, default=8)
+    parser.add_argument("--neighbourhoods", type=int, default=10)
+    parser.add_argument("--hoodmaps-latency", type=float, default=0.2)
+    parser.add_argument("--rss-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    parser.add_argument("--echo-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    names = [(f"Hood{i}", "quiet families expat") for i in range(args.neighbourhoods)]
+    with hoodmaps_stub(names, latency=args.hoodmaps_latency) as hoodmaps, \
+            rss_stub(latency=args.rss_latency) as rss, \
+            llm_stub(latency=args.llm_latency) as llm, \
+            echo_stub(latency=args.echo_latency) as echo:
+        city_processor.HOODMAPS_URL = hoodmaps.url + "/{city}-neighborhood-map"
+        city_processor.GOOGLE_NEWS_RSS_URL = rss.url + "/rss/search?q={query}+near+me"
+        city_processor.HTTP_CACHE = None
+        something.LLM_BASE_URL = llm.url + "/v1"
+        something.RESPONSE_CACHE = None
+        something.ASSESSMENT_CACHE = None
+        # The ASGI app does not coalesce concurrent requests either
+        main.assess_city_coalesced = pipeline.assess_city
+        main.EXTERNAL_API_URL = echo.url + "/post"
+
+        print(f"{args.clients} clients, {args.duration:.0f}s per server, "
+              f"{args.neighbourhoods} neighbourhoods per city")
+
+        url, stop = start_sync_server(args.sync_threads)
+        try:
+            report("sync", *run_load(url, args.clients, args.duration, "testville"))
+        finally:
+            stop()
+
+        url, stop = start_async_server()
+        try:
+            report("async", *run_load(url, args.clients, args.duration, "testville"))
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compares serial, concurrent and batched news fetching in city_processor
+against a local fake HoodMaps page and a fake Google News RSS server.
+
+    python experimentation/news_fetch_harness.py --neighbourhoods 40 --latency 0.2
+
+One neighbourhood is served by a feed that hangs and one by a feed that
+errors, to show they degrade to an empty `news` list. In batched mode that
+takes its whole group's feed down with it.
+
+Then two cities share one small pool (as in /process_cities) and the city
+queued behind the other must still get all of its news.
+
+Last, every feed carries the same city-wide headlines and answers in a
+random order: deduplication must still give them to the same
+neighbourhoods on every run, concurrent or streamed.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "flaskapp"))
+
+import city_processor  # noqa: E402
+from news_query import NewsQuery  # noqa: E402
+from stub_servers import hoodmaps_stub, overlapping_rss_stub, rss_stub  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--neighbourhoods", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per RSS response")
+    parser.add_argument("--workers", type=int, default=city_processor.NEWS_MAX_WORKERS)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--group-size", type=int, default=8)
+    args = parser.parse_args()
+
+    names = [(f"Hood{i}", "quiet families expat") for i in range(args.neighbourhoods)]
+    names[1] = ("Slowhood", "party students")
+    names[2] = ("Brokenhood", "crime ghetto")
+
+    with hoodmaps_stub(names) as hoodmaps, \
+            rss_stub(latency=args.latency, slow=("Slowhood",), failing=("Brokenhood",)) as rss:
+        city_processor.HOODMAPS_URL = hoodmaps.url + "/{city}-neighborhood-map"
+        city_processor.GOOGLE_NEWS_RSS_URL = rss.url + "/rss/search?q={query}+near+me"
+        city_processor.HTTP_CACHE = None  # time the network path, not the cache
+
+        batched = NewsQuery(keywords=("crime",), batch="grouped", group_size=args.group_size)
+        runs = (
+            ("serial", False, None),
+            ("concurrent", True, None),
+            ("batched", True, batched),
+        )
+        results = {}
+        for label, concurrent, query in runs:
+            requests_before = rss.requests
+            started = time.perf_counter()
+            data = city_processor.process_city_data(
+                "testville", concurrent=concurrent,
+                max_workers=args.workers, timeout=args.timeout, query=query,
+            )
+            elapsed = time.perf_counter() - started
+            results[label] = (elapsed, data)
+            empty = [d["neighbourhood"] for d in data if not d["news"]]
+            shown = empty if len(empty) <= 4 else f"{len(empty)} neighbourhoods"
+            print(f"{label:>10}: {elapsed:6.2f}s  {len(data)} neighbourhoods, "
+                  f"{rss.requests - requests_before} RSS requests, empty news: {shown}")
+
+        serial_names = [d["neighbourhood"] for d in results["serial"][1]]
+        for label in ("concurrent", "batched"):
+            names_ = [d["neighbourhood"] for d in results[label][1]]
+            assert serial_names == names_, f"{label} mode changed the HoodMaps order"
+        print(f"   speedup: {results['serial'][0] / results['concurrent'][0]:.1f}x concurrent, "
+              f"{results['serial'][0] / results['batched'][0]:.1f}x batched")
+
+        # Shared pool: "queuedville" waits for all of "testville"'s feeds
+        # before its own start, far longer than its per-feed timeout
+        timeout = args.latency * 3
+        with ThreadPoolExecutor(max_workers=2) as pool, ThreadPoolExecutor(max_workers=1) as first:
+            started = time.perf_counter()
+            ahead = first.submit(city_processor.process_city_data, "testville",
+                                 timeout=timeout, executor=pool)
+            time.sleep(args.latency / 2)
+            data = city_processor.process_city_data("queuedville", timeout=timeout, executor=pool)
+            ahead.result()
+            elapsed = time.perf_counter() - started
+        empty = [d["neighbourhood"] for d in data if not d["news"]]
+        print(f"    shared: {elapsed:6.2f}s  2 cities on 2 threads, empty news: {empty}")
+        assert set(empty) <= {"Slowhood", "Brokenhood"}, "a queued city lost its news"
+
+    # Same upstream data, feeds finishing in a different order every run
+    with hoodmaps_stub(names[3:13]) as hoodmaps, overlapping_rss_stub() as rss:
+        city_processor.HOODMAPS_URL = hoodmaps.url + "/{city}-neighborhood-map"
+        city_processor.GOOGLE_NEWS_RSS_URL = rss.url + "/rss/search?q={query}+near+me"
+        expected = city_processor.process_city_data("testville", concurrent=False)
+        for _ in range(5):
+            assert city_processor.process_city_data("testville") == expected, \
+                "concurrent dedup depends on fetch order"
+            streamed = sorted(city_processor.iter_city_data("testville"), key=lambda item: item[0])
+            assert [info for _, info in streamed] == expected, "streamed dedup depends on fetch order"
+        print(f"     dedup: same news on every run; city-wide headlines kept by "
+              f"{expected[0]['neighbourhood']}")
+
+if __name__ == "__main__":
+    main()
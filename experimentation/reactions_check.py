@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks POST /reactions against the bodies the frontend may send: rows that
+name different emoji_N keys, null counts, and counts that are not
+non-negative whole numbers.
+
+    python experimentation/reactions_check.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "flaskapp"))
+
+import main  # noqa: E402
+from emoji_store import EmojiStore  # noqa: E402
+
+ROW = {"city": "checkville", "neighbourhood": "Centrum", "place": "Cafe"}
+
+
+def run():
+    main.EMOJI_STORE = store = EmojiStore()
+    client = main.app.test_client()
+
+    def post(rows):
+        return client.post("/reactions", json=rows).status_code
+
+    mixed = [{**ROW, "emoji_1": 2}, {**ROW, "place": "Park", "emoji_2": 1}]
+    assert post(mixed) == 200, "rows with different emoji keys were rejected"
+    counts = store.city_slice("checkville").set_index("place")
+    assert counts.loc["Cafe", "emoji_1"] == 2 and counts.loc["Cafe", "emoji_2"] == 0
+    assert counts.loc["Park", "emoji_2"] == 1 and counts.loc["Park", "emoji_1"] == 0
+
+    assert post([{**ROW, "emoji_4": None}]) == 200, "a null count was rejected"
+    assert post([{**ROW, "emoji_4": "many"}]) == 400
+    assert post([{**ROW, "emoji_4": [1]}]) == 400
+    assert post([{**ROW, "emoji_4": -5}]) == 400, "a negative count was stored"
+    assert post([{**ROW, "emoji_4": 1.9}]) == 400, "a fractional count was truncated"
+    assert store.city_slice("checkville").set_index("place").loc["Cafe", "emoji_4"] == 0
+    assert post([{"city": "checkville", "emoji_4": 1}]) == 400
+    print("/reactions accepts mixed and null counts, rejects invalid ones with 400")
+
+
+if __name__ == "__main__":
+    run()
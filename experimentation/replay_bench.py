@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline replay benchmark of the whole /process_city pipeline
+(process_city_data -> news -> emoji stats -> generate_neighbourhood_safety_json
+-> external API), with HoodMaps, Google News, the LLM endpoint and httpbin
+replaced by local stub servers that replay recorded responses.
+
+Record real responses once (needs network access and OPENAI_API_KEY):
+
+    python experimentation/replay_bench.py record --city amsterdam
+
+Replay them at several concurrency levels and compare with the baseline:
+
+    python experimentation/replay_bench.py run --city amsterdam --concurrency 1,4,16
+    python experimentation/replay_bench.py run --save-baseline   # accept new numbers
+
+Without a recording for --city the bundled fixtures are used
+(fixtures/hoodmaps_amsterdam.html for HoodMaps, fixtures/google_news_rss.xml
+for every news query, stub_servers.fake_llm_answer for the model).
+
+Stage times come from the pipeline's own metrics (metrics.stage) and are
+summed per request, so a stage that runs once per neighbourhood on a thread
+pool (news_fetch) can add up to more than the request's wall time. All
+caches are disabled, so every request runs the full pipeline. The run exits
+with status 1 when a p50 (or, with enough samples, a p95) or the throughput
+is more than --tolerance worse than the baseline.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "flaskapp"))
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+os.environ.setdefault("BIBBLE_EXTERNAL_QUEUE", "0")   # time the external POST inline
+
+import city_processor  # noqa: E402
+import metrics  # noqa: E402
+import something  # noqa: E402
+from stub_servers import StubServer, echo_stub, fake_llm_answer, llm_stub  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+REPLAY_DIR = os.path.join(FIXTURES, "replay")
+BASELINE = os.path.join(FIXTURES, "replay_baseline.json")
+
+# Absolute slowdowns below this many seconds are never reported as regressions
+NOISE_FLOOR = 0.005
+# p95 is only compared with at least this many samples (below, it is the maximum)
+MIN_P95_SAMPLES = 20
+
+
+def _slug(city: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", city.lower()).strip("-")
+
+
+def _llm_key(records) -> str:
+    # Recorded answers are looked up by the neighbourhoods of a prompt only,
+    # so they still match when the (synthetic) emoji stats differ
+    return "|".join(sorted(r.get("neighbourhood", "") for r in records))
+
+
+# ----------------------------------------------------------------------
+# fixtures
+# ----------------------------------------------------------------------
+class Fixtures:
+    """
+    Recorded upstream responses for one city:
+
+        hoodmaps.html   the HoodMaps page
+        news.json       {Google News query: RSS document}
+        llm.json        {neighbourhoods of a prompt: model answer}
+    """
+
+    def __init__(self, city, hoodmaps_html, news, llm, default_news=None):
+        self.city = city
+        self.hoodmaps_html = hoodmaps_html
+        self.news = news
+        self.llm = llm
+        self.default_news = default_news
+
+    @classmethod
+    def load(cls, city: str) -> "Fixtures":
+        directory = os.path.join(REPLAY_DIR, _slug(city))
+        if not os.path.isdir(directory):
+            print(f"No recording in {directory}, using the bundled fixtures")
+            return cls.bundled(city)
+        with open(os.path.join(directory, "hoodmaps.html"), encoding="utf-8") as f:
+            html = f.read()
+        with open(os.path.join(directory, "news.json"), encoding="utf-8") as f:
+            news = json.load(f)
+        with open(os.path.join(directory, "llm.json"), encoding="utf-8") as f:
+            llm = json.load(f)
+        return cls(city, html, news, llm)
+
+    @classmethod
+    def bundled(cls, city: str) -> "Fixtures":
+        with open(os.path.join(FIXTURES, "hoodmaps_amsterdam.html"), encoding="utf-8") as f:
+            html = f.read()
+        with open(os.path.join(FIXTURES, "google_news_rss.xml"), encoding="utf-8") as f:
+            rss = f.read()
+        # The saved page is Amsterdam's; serve it under the requested city's name
+        html = html.replace("Amsterdam Neighborhood Map:", f"{city.capitalize()} Neighborhood Map:")
+        return cls(city, html, {}, {}, default_news=rss)
+
+    def save(self):
+        directory = os.path.join(REPLAY_DIR, _slug(self.city))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "hoodmaps.html"), "w", encoding="utf-8") as f:
+            f.write(self.hoodmaps_html)
+        for name, data in (("news.json", self.news), ("llm.json", self.llm)):
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+        return directory
+
+
+def record(city: str) -> Fixtures:
+    """
+    Fetches the real HoodMaps page and news feeds for `city`, then the real
+    model answers for the records built from them.
+    """
+    from llm_batching import split_records
+    from pipeline import EMOJI_STORE
+
+    city_lower = city.lower()
+    city_title = city_lower.capitalize()
+    html = city_processor.fetch("hoodmaps", city_processor.HOODMAPS_URL.format(city=city_lower))
+    html = html.decode("utf-8", errors="replace")
+    neighbourhoods = city_processor.parse_hoodmaps_neighbourhoods(html, city_title)
+    if not neighbourhoods:
+        raise RuntimeError(f"HoodMaps has no neighbourhood data for {city}")
+
+    query = city_processor.NEWS_QUERY
+    names = [name for name, _ in neighbourhoods]
+    if query.batch != "off":
+        urls = city_processor.news_batch_urls(names, city_title, query)
+    else:
+        urls = [city_processor.news_query_url(name, city_title, query.keywords) for name in names]
+    news = {}
+    for url in urls:
+        q = parse_qs(urlparse(url).query)["q"][0]
+        news[q] = city_processor.fetch("news", url).decode("utf-8", errors="replace")
+    fixtures = Fixtures(city_lower, html, news, {})
+
+    # Build the prompts from the recorded feeds, exactly as a replay will
+    hoodmaps, rss = hoodmaps_replay(fixtures), rss_replay(fixtures)
+    with hoodmaps, rss:
+        saved = (city_processor.HOODMAPS_URL, city_processor.GOOGLE_NEWS_RSS_URL)
+        point_at(hoodmaps, rss)
+        try:
+            processed = city_processor.process_city_data(city_lower)
+        finally:
+            city_processor.HOODMAPS_URL, city_processor.GOOGLE_NEWS_RSS_URL = saved
+    records = something.build_safety_records(
+        processed, EMOJI_STORE.city_slice(city_lower), EMOJI_STORE.emoji4_ratios(city_lower),
+    )
+    for chunk in split_records(records):
+        fixtures.llm[_llm_key(chunk)] = something._complete(chunk)
+    return fixtures
+
+
+# ----------------------------------------------------------------------
+# replay stubs
+# ----------------------------------------------------------------------
+def hoodmaps_replay(fixtures: Fixtures, latency: float = 0.0) -> StubServer:
+    page = fixtures.hoodmaps_html.encode("utf-8")
+
+    def handler(method, path, query, body):
+        return 200, "text/html; charset=utf-8", page
+    return StubServer(handler, latency=latency)
+
+
+def rss_replay(fixtures: Fixtures, latency: float = 0.0) -> StubServer:
+    feeds = {q: xml.encode("utf-8") for q, xml in fixtures.news.items()}
+    default = (fixtures.default_news or next(iter(fixtures.news.values()), "")).encode("utf-8")
+
+    def handler(method, path, query, body):
+        q = " ".join(query.get("q", [""]))
+        return 200, "application/rss+xml", feeds.get(q, default)
+    return StubServer(handler, latency=latency)
+
+
+def llm_replay(fixtures: Fixtures, latency: float = 0.0) -> StubServer:
+    def answer(records):
+        recorded = fixtures.llm.get(_llm_key(records))
+        return recorded if recorded is not None else fake_llm_answer(records)
+    return llm_stub(latency=latency, answer=answer)
+
+
+def point_at(hoodmaps=None, rss=None, llm=None, echo=None):
+    """Points the pipeline at the given stubs and disables every cache."""
+    import main
+
+    if hoodmaps is not None:
+        city_processor.HOODMAPS_URL = hoodmaps.url + "/{city}-neighborhood-map"
+    if rss is not None:
+        # Keep "near me" inside q, like the real URL
+        city_processor.GOOGLE_NEWS_RSS_URL = rss.url + "/rss/search?q={query}+near+me"
+    city_processor.HTTP_CACHE = None
+    if llm is not None:
+        something.LLM_BASE_URL = llm.url + "/v1"
+    something.RESPONSE_CACHE = None
+    something.ASSESSMENT_CACHE = None
+    if echo is not None:
+        main.EXTERNAL_API_URL = echo.url + "/post"
+
+
+# ----------------------------------------------------------------------
+# measurement
+# ----------------------------------------------------------------------
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def _summary(values) -> dict:
+    return {f"p{q}": percentile(values, q) for q in (50, 95, 99)}
+
+
+def one_request(city: str):
+    """Runs the pipeline for `city` once: (seconds, {stage: seconds})."""
+    import main
+    import pipeline
+
+    token = metrics.start_trace()
+    started = time.perf_counter()
+    try:
+        with metrics.stage("end_to_end"):
+            result = pipeline.assess_city(city)
+            if result is None:
+                raise RuntimeError(f"no neighbourhood data for {city}")
+            main.send_to_external_api(result["neighbourhoods"])
+    finally:
+        elapsed = time.perf_counter() - started
+        stages = metrics.end_trace(token)
+    return elapsed, {name: seconds for name, (seconds, _, _) in stages.items() if name != "end_to_end"}
+
+
+def run_level(city: str, concurrency: int, requests: int) -> dict:
+    """`requests` pipeline runs with `concurrency` in flight at once."""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: one_request(city), range(requests)))
+        wall = time.perf_counter() - started
+    stage_names = sorted({name for _, stages in results for name in stages})
+    return {
+        "requests": requests,
+        "throughput": requests / wall,
+        "end_to_end": _summary([elapsed for elapsed, _ in results]),
+        "stages": {
+            name: _summary([stages.get(name, 0.0) for _, stages in results])
+            for name in stage_names
+        },
+    }
+
+
+def time_synthetic_data(repeat: int = 3) -> dict:
+    from userInput import generate_synthetic_tourist_data
+
+    out = {}
+    for label, vectorized in (("faker", False), ("vectorized", True)):
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            generate_synthetic_tourist_data(vectorized=vectorized)
+            runs.append(time.perf_counter() - started)
+        out[label] = _summary(runs)
+    return out
+
+
+# ----------------------------------------------------------------------
+# reporting
+# ----------------------------------------------------------------------
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:9.1f}"
+
+
+def report(results: dict):
+    for level, data in results["levels"].items():
+        e2e = data["end_to_end"]
+        print(f"\nconcurrency {level}: {data['requests']} requests, "
+              f"{data['throughput']:.2f} req/s")
+        print(f"  {'stage':<18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        print(f"  {'end_to_end':<18} {_ms(e2e['p50'])} {_ms(e2e['p95'])} {_ms(e2e['p99'])}")
+        for name, s in data["stages"].items():
+            print(f"  {name:<18} {_ms(s['p50'])} {_ms(s['p95'])} {_ms(s['p99'])}")
+    print("\nsynthetic data (default table)")
+    for label, s in results["synthetic_data"].items():
+        print(f"  {label:<18} {_ms(s['p50'])} {_ms(s['p95'])}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of `results` against `baseline`, as printable lines."""
+    found = []
+
+    def check(label, new, old, samples):
+        for q in ("p50", "p95") if samples >= MIN_P95_SAMPLES else ("p50",):
+            if q in old and new[q] > old[q] * (1 + tolerance) and new[q] - old[q] > NOISE_FLOOR:
+                found.append(f"{label} {q}: {old[q] * 1000:.1f} -> {new[q] * 1000:.1f} ms "
+                             f"(+{(new[q] / old[q] - 1) * 100:.0f}%)")
+
+    for level, data in results["levels"].items():
+        old = baseline.get("levels", {}).get(level)
+        if old is None:
+            continue
+        samples = min(data["requests"], old["requests"])
+        check(f"c={level} end_to_end", data["end_to_end"], old["end_to_end"], samples)
+        for name, s in data["stages"].items():
+            if name in old["stages"]:
+                check(f"c={level} {name}", s, old["stages"][name], samples)
+        if data["throughput"] < old["throughput"] / (1 + tolerance):
+            found.append(f"c={level} throughput: {old['throughput']:.2f} -> "
+                         f"{data['throughput']:.2f} req/s")
+    for label, s in results["synthetic_data"].items():
+        old = baseline.get("synthetic_data", {}).get(label)
+        if old is not None:
+            check(f"synthetic_data {label}", s, old, 0)
+    return found
+
+
+# ----------------------------------------------------------------------
+# commands
+# ----------------------------------------------------------------------
+def cmd_record(args):
+    directory = record(args.city).save()
+    print(f"Recorded {args.city} into {directory}")
+
+
+def cmd_run(args):
+    fixtures = Fixtures.load(args.city)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    settings = {
+        "city": args.city,
+        "hoodmaps_latency": args.hoodmaps_latency,
+        "rss_latency": args.rss_latency,
+        "llm_latency": args.llm_latency,
+        "echo_latency": args.echo_latency,
+    }
+
+    with hoodmaps_replay(fixtures, args.hoodmaps_latency) as hoodmaps, \
+            rss_replay(fixtures, args.rss_latency) as rss, \
+            llm_replay(fixtures, args.llm_latency) as llm, \
+            echo_stub(args.echo_latency) as echo:
+        point_at(hoodmaps, rss, llm, echo)
+        one_request(args.city)   # warm up: imports, pools, emoji store
+        results = {"settings": settings, "levels": {}}
+        for level in levels:
+            requests = max(args.requests, level * 2)
+            results["levels"][str(level)] = run_level(args.city, level, requests)
+    results["synthetic_data"] = time_synthetic_data()
+    report(results)
+
+    if args.save_baseline:
+        results["recorded_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline} (use --save-baseline)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != settings:
+        print("\n⚠️ Baseline was recorded with different settings; comparison may be off")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="record real responses into fixtures/replay/")
+    rec.add_argument("--city", default="amsterdam")
+    rec.set_defaults(func=cmd_record)
+
+    run = commands.add_parser("run", help="replay the fixtures and time the pipeline")
+    run.add_argument("--city", default="amsterdam")
+    run.add_argument("--concurrency", default="1,4,16", help="comma-separated levels")
+    run.add_argument("--requests", type=int, default=20, help="requests per level (at least 2x the level)")
+    run.add_argument("--hoodmaps-latency", type=float, default=0.2)
+    run.add_argument("--rss-latency", type=float, default=0.2)
+    run.add_argument("--llm-latency", type=float, default=1.5)
+    run.add_argument("--echo-latency", type=float, default=0.1)
+    run.add_argument("--baseline", default=BASELINE)
+    run.add_argument("--save-baseline", action="store_true")
+    run.add_argument("--tolerance", type=float, default=0.25,
+                     help="allowed slowdown against the baseline (0.25 = 25%%)")
+    run.set_defaults(func=cmd_run)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == "__main__":
+    main_()
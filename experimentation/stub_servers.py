@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins for the upstream services the Flask backend talks to, so
+the pipeline can be exercised and timed without touching the internet.
+
+Each stub runs a ThreadingHTTPServer on a background thread and can add a
+fixed latency to every response.
+"""
+import json
+import random
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def fake_hoodmaps_html(city_title: str, neighbourhoods):
+    """Builds a page shaped like hoodmaps.com with the `<em>` description block."""
+    payload = ", ".join(f"{name}: {desc}" for name, desc in neighbourhoods)
+    return (
+        "<html><head><title>Neighborhood map</title></head><body>"
+        + "<div class='filler'>" + ("lorem ipsum " * 2000) + "</div>"
+        + f"<p><em class='hood-desc'>{city_title} Neighborhood Map: {payload}</em></p>"
+        + "<div class='footer'>" + ("dolor sit amet " * 2000) + "</div>"
+        + "</body></html>"
+    )
+
+
+def fake_rss_xml(query: str, items: int = 20):
+    """
+    Builds a Google News-style RSS document with `items` entries. For an
+    OR-ed query (``("A" OR "B") city crime``) the entries take turns
+    mentioning each of the quoted names.
+    """
+    now = time.time()
+    names = re.findall(r'"([^"]+)"', query)
+    entries = []
+    for i in range(items):
+        published = formatdate(now - i * 3600, usegmt=True)
+        subject = f"{names[i % len(names)]} {query.split(')')[-1].strip()}" if names else query
+        entries.append(
+            "<item>"
+            f"<title>Headline {i} for {subject}</title>"
+            f"<link>https://example.invalid/{i}</link>"
+            f"<pubDate>{published}</pubDate>"
+            f"<description>&lt;a href=\"https://example.invalid/{i}\"&gt;Police report {i} "
+            f"about {subject}&lt;/a&gt;&amp;nbsp;&lt;font color=\"#6f6f6f\"&gt;Local Paper&lt;/font&gt;"
+            "</description>"
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0"><channel><title>stub feed</title>'
+        + "".join(entries)
+        + "</channel></rss>"
+    )
+
+
+class StubServer:
+    """
+    Minimal HTTP server on 127.0.0.1 that answers every GET/POST through
+    ``handler(method, path, query, body) -> (status, content_type, bytes)``.
+    """
+
+    def __init__(self, handler, latency: float = 0.0, port: int = 0):
+        self.handler = handler
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parsed = urlparse(self.path)
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, content_type, data = stub.handler(
+                    method, parsed.path, parse_qs(parsed.query), body
+                )
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def hoodmaps_stub(neighbourhoods, latency: float = 0.0):
+    """HoodMaps stub: serves the same neighbourhood list for every city."""
+    def handler(method, path, query, body):
+        city = path.strip("/").split("-neighborhood-map")[0]
+        html = fake_hoodmaps_html(city.capitalize(), neighbourhoods)
+        return 200, "text/html; charset=utf-8", html.encode("utf-8")
+    return StubServer(handler, latency=latency)
+
+
+def rss_stub(latency: float = 0.0, items: int = 20, slow=(), failing=(), slow_latency: float = 30.0):
+    """
+    Google News stub. Queries containing a word from ``slow`` sleep for
+    ``slow_latency`` seconds, queries containing a word from ``failing``
+    get a 500.
+    """
+    def handler(method, path, query, body):
+        q = " ".join(query.get("q", [""]))
+        if any(word in q for word in failing):
+            return 500, "text/plain", b"upstream error"
+        if any(word in q for word in slow):
+            time.sleep(slow_latency)
+        return 200, "application/rss+xml", fake_rss_xml(q, items).encode("utf-8")
+    return StubServer(handler, latency=latency)
+
+
+def overlapping_rss_stub(shared: int = 5, items: int = 10, jitter: float = 0.05):
+    """
+    Google News stub whose feeds all start with the same `shared` city-wide
+    headlines, each answered after a random 0-`jitter` s delay, so feeds
+    finish in a different order every run.
+    """
+    def handler(method, path, query, body):
+        q = " ".join(query.get("q", [""]))
+        time.sleep(random.uniform(0, jitter))
+        xml = fake_rss_xml(q, items)
+        city_wide = "".join(
+            f"<item><title>Citywide story {i} - Daily</title>"
+            f"<link>https://example.invalid/city/{i}</link>"
+            f"<pubDate>{formatdate(time.time() - i * 60, usegmt=True)}</pubDate>"
+            f"<description>Citywide story {i}</description></item>"
+            for i in range(shared)
+        )
+        xml = xml.replace("</title><item>", "</title>" + city_wide + "<item>", 1)
+        return 200, "application/rss+xml", xml.encode("utf-8")
+    return StubServer(handler)
+
+
+def fake_llm_answer(records):
+    """A well-formed model answer for the records of one safety prompt."""
+    return json.dumps([
+        {
+            "Neighbourhood": r.get("neighbourhood", ""),
+            "Safety Score": f"{min(5.0, 2.5 + 2.5 * float(r.get('emoji4_ratio') or 0)):.1f}/5.0",
+            "Top 3 Safe Places": [p["place"] for p in r.get("top_places_counts", [])][:3],
+            "Safety Overview": "Stub overview.",
+            "Social Character": "Stub character.",
+        }
+        for r in records
+    ], ensure_ascii=False)
+
+
+def llm_stub(latency: float = 0.0, answer=fake_llm_answer):
+    """
+    OpenAI-compatible chat completions stub (POST /v1/chat/completions).
+    Answers with ``answer(records)`` for the JSON records in the user
+    message, as one completion or as an SSE stream when ``stream`` is set.
+    """
+    def handler(method, path, query, body):
+        request = json.loads(body or b"{}")
+        user = next((m["content"] for m in request.get("messages", []) if m["role"] == "user"), "[]")
+        try:
+            records = json.loads(user)
+        except ValueError:
+            records = []
+        content = answer(records)
+        usage = {"prompt_tokens": len(user) // 4, "completion_tokens": len(content) // 4,
+                 "total_tokens": (len(user) + len(content)) // 4}
+        base = {"id": "stub", "created": int(time.time()), "model": request.get("model", "stub")}
+        if request.get("stream"):
+            events = []
+            for i in range(0, len(content), 40):
+                chunk = dict(base, object="chat.completion.chunk", choices=[
+                    {"index": 0, "delta": {"content": content[i:i + 40]}, "finish_reason": None}
+                ])
+                events.append(f"data: {json.dumps(chunk)}\n\n")
+            if (request.get("stream_options") or {}).get("include_usage"):
+                # Like the real API: a last chunk with no choices, only the usage
+                chunk = dict(base, object="chat.completion.chunk", choices=[], usage=usage)
+                events.append(f"data: {json.dumps(chunk)}\n\n")
+            events.append("data: [DONE]\n\n")
+            return 200, "text/event-stream", "".join(events).encode("utf-8")
+        completion = dict(base, object="chat.completion", usage=usage, choices=[
+            {"index": 0, "finish_reason": "stop",
+             "message": {"role": "assistant", "content": content}}
+        ])
+        return 200, "application/json", json.dumps(completion).encode("utf-8")
+    return StubServer(handler, latency=latency)
+
+
+def echo_stub(latency: float = 0.0):
+    """httpbin.org/post stand-in: echoes the posted JSON back."""
+    def handler(method, path, query, body):
+        try:
+            posted = json.loads(body or b"null")
+        except ValueError:
+            posted = None
+        return 200, "application/json", json.dumps({"json": posted}).encode("utf-8")
+    return StubServer(handler, latency=latency)
@@ -0,0 +1,136 @@
+# asgi.py
+#
+# ASGI entry point for the async pipeline (see async_pipeline.py):
+#
+#     uvicorn asgi:app --port 5001
+#
+# Serves POST /process_city with the same request and response shape as
+# the Flask app in main.py. One pooled HTTP client and one LLM client are
+# created at startup and shared by every request in the worker.
+
+import asyncio
+import json
+
+import main
+from async_pipeline import (
+    generate_neighbourhood_safety_json_async,
+    new_llm_client,
+    process_city_data_async,
+    send_to_external_api_async,
+)
+from http_client import new_async_client
+from pipeline import normalize_city
+
+
+class _State:
+    client = None   # httpx.AsyncClient
+    llm = None      # AsyncOpenAI
+
+
+state = _State()
+
+
+async def startup():
+    state.client = new_async_client()
+    state.llm = new_llm_client(state.client)
+
+
+async def shutdown():
+    if state.client is not None:
+        await state.client.aclose()
+    state.client = state.llm = None
+
+
+async def process_city(body: dict):
+    city = body.get('city')
+    print(f"Received city: {city}")
+
+    if not city:
+        return 400, {"error": "City parameter is required!"}
+
+    city = normalize_city(city)
+    processed_data = await process_city_data_async(state.client, city)
+    if processed_data is None:
+        return 404, {"error": f"No neighbourhood data found for {city}"}
+
+    # SQLite reads are blocking; run them on a thread
+    emoji_table = await asyncio.to_thread(main.EMOJI_STORE.city_slice, city)
+    emoji_ratio = await asyncio.to_thread(main.EMOJI_STORE.emoji4_ratios, city)
+
+    final_json = await generate_neighbourhood_safety_json_async(
+        state.llm, processed_data, emoji_table, emoji_ratio=emoji_ratio,
+        fast=bool(body.get("fast")),
+    )
+    print(f"Processed data: {final_json}")
+
+    if main.DELIVERY is not None:
+        # Queued for the background sender shared with the Flask app
+        queued = await asyncio.to_thread(main.DELIVERY.submit, {"city_info": processed_data})
+        return 200, {"status": "success", "assessment": final_json,
+                     "external_response": {"queued": queued}}
+    external_response = await send_to_external_api_async(
+        state.client, main.EXTERNAL_API_URL, processed_data
+    )
+    return 200, {"status": "success", "assessment": final_json,
+                 "external_response": external_response.json()}
+
+
+ROUTES = {
+    ("POST", "/process_city"): process_city,
+}
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status: int, data):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        await _send_json(send, 404, {"error": "Not found"})
+        return
+
+    try:
+        body = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        await _send_json(send, 400, {"error": "Invalid JSON body"})
+        return
+
+    try:
+        status, data = await handler(body)
+    except Exception as e:
+        print(f"❌ {scope['path']} failed: {e!r}")
+        status, data = 500, {"error": str(e)}
+    await _send_json(send, status, data)
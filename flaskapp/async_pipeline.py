@@ -0,0 +1,257 @@
+# async_pipeline.py
+#
+# Non-blocking version of the /process_city pipeline. HoodMaps, the RSS
+# feeds, the LLM and the external API are all reached through one shared,
+# pooled httpx.AsyncClient, so a single worker can have many cities in
+# flight at once. Parsing and record building reuse the sync modules.
+
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from openai import AsyncOpenAI
+
+import city_processor
+import something
+from llm_batching import split_records
+from llm_output import parse_assessments
+from metrics import record_llm_usage, stage
+from scoring import local_assessments
+from city_processor import (
+    HEADERS,
+    NEWS_MAX_WORKERS,
+    NEWS_TIMEOUT,
+    host_max_wait,
+    last_known_good,
+    lost_items,
+    news_batch_urls,
+    news_query_url,
+    parse_hoodmaps_neighbourhoods,
+)
+from host_limiter import retry_after_seconds
+from news_query import HeadlineDeduper, NewsQuery, assign_articles, summarize_feeds
+
+
+async def fetch_async(client, source: str, url: str, timeout: float = None) -> bytes:
+    """Async counterpart of city_processor.fetch (same HTTP cache and host limits)."""
+    cache = city_processor.HTTP_CACHE
+    validators, entry = {}, None
+    if cache is not None:
+        body, validators, entry = cache.lookup(source, url)
+        if body is not None:
+            return body
+
+    limiter = city_processor.HOST_LIMITER
+    host = urlsplit(url).netloc
+    started = time.monotonic()
+    if limiter is not None and not await _acquire_host(limiter, host, timeout):
+        return last_known_good(source, url, entry, RuntimeError(f"{host} is throttled or unavailable"))
+    if timeout is not None:
+        timeout -= time.monotonic() - started
+    try:
+        resp = await client.get(url, headers={**HEADERS, **validators}, timeout=timeout)
+        if not (resp.status_code == 304 and entry is not None):
+            resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        if limiter is not None:
+            await asyncio.to_thread(limiter.record, host, status=e.response.status_code,
+                                    retry_after=retry_after_seconds(e.response.headers))
+        return last_known_good(source, url, entry, e)
+    except httpx.HTTPError as e:
+        if limiter is not None:
+            await asyncio.to_thread(limiter.record, host, error=True)
+        return last_known_good(source, url, entry, e)
+    if resp.status_code != 304 and lost_items(source, resp.content, entry):
+        if limiter is not None:
+            await asyncio.to_thread(limiter.record, host, error=True)
+        return last_known_good(source, url, entry, RuntimeError(f"{host} returned an empty feed"))
+    if limiter is not None:
+        await asyncio.to_thread(limiter.record, host, status=resp.status_code)
+
+    if cache is None:
+        return resp.content
+    return cache.store(source, url, resp.status_code, resp.content, resp.headers, entry)
+
+
+async def _acquire_host(limiter, host, timeout):
+    # HostLimiter.acquire without blocking the event loop
+    deadline = time.monotonic() + host_max_wait(timeout)
+    while True:
+        wait = await asyncio.to_thread(limiter.reserve, host)
+        if wait is None:
+            return False
+        if wait <= 0:
+            return True
+        if time.monotonic() + wait > deadline:
+            return False
+        await asyncio.sleep(wait)
+
+
+async def _feed_async(client, semaphore, url, timeout):
+    try:
+        async with semaphore:
+            with stage("news_fetch"):
+                return await asyncio.wait_for(fetch_async(client, "news", url, timeout), timeout)
+    except Exception as e:
+        print(f"⚠️ News fetch failed for {url}: {e!r}")
+        return None
+
+
+async def _news_batched_async(client, semaphore, names, city, query, timeout, seen):
+    contents = await asyncio.gather(*(
+        _feed_async(client, semaphore, url, timeout)
+        for url in news_batch_urls(names, city, query)
+    ))
+    with stage("news_parse"):
+        return await asyncio.to_thread(assign_articles, contents, names, query, seen)
+
+
+async def process_city_data_async(client, city_lower: str,
+                                  max_concurrency: int = NEWS_MAX_WORKERS,
+                                  timeout: float = NEWS_TIMEOUT,
+                                  query: NewsQuery = None):
+    """Async ``process_city_data``: same output, in HoodMaps order."""
+    city_title = city_lower.capitalize()
+    url = city_processor.HOODMAPS_URL.format(city=city_lower)
+    with stage("hoodmaps_fetch"):
+        html = (await fetch_async(client, "hoodmaps", url)).decode("utf-8", errors="replace")
+    with stage("hoodmaps_parse"):
+        neighbourhoods = parse_hoodmaps_neighbourhoods(html, city_title)
+    if neighbourhoods is None:
+        return
+
+    query = query or city_processor.NEWS_QUERY
+    seen = HeadlineDeduper() if query.dedup else None
+    semaphore = asyncio.Semaphore(max_concurrency)
+    if query.batch != "off":
+        names = [name for name, _ in neighbourhoods]
+        news = await _news_batched_async(client, semaphore, names, city_title, query, timeout, seen)
+    else:
+        # Fetched concurrently, deduplicated in HoodMaps order
+        contents = await asyncio.gather(*(
+            _feed_async(client, semaphore, news_query_url(name, city_title, query.keywords), timeout)
+            for name, _ in neighbourhoods
+        ))
+        # RSS parsing + summary cleaning are CPU work; keep them off the event loop
+        with stage("news_parse"):
+            news = await asyncio.to_thread(summarize_feeds, contents, query, seen)
+    return [
+        {"neighbourhood": name, "description": desc, "news": summaries}
+        for (name, desc), summaries in zip(neighbourhoods, news)
+    ]
+
+
+def new_llm_client(http_client) -> AsyncOpenAI:
+    """
+    AsyncOpenAI client that shares the pipeline's connection pool, with the
+    timeout and retry policy of something.llm_gateway().
+    """
+    return AsyncOpenAI(
+        base_url=something.LLM_BASE_URL,
+        api_key=something._api_key(),
+        timeout=something.LLM_TIMEOUT,
+        max_retries=something.LLM_MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+async def _complete_async(llm, records):
+    cache = something.RESPONSE_CACHE
+    cache_key = something._cache_key(records)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    params = {"prompt_cache_key": something.SYSTEM_PROMPT_SHA[:32]} if something.LLM_PROMPT_CACHE else {}
+    with stage("llm_call"):
+        response = await llm.chat.completions.create(
+            model=something.LLM_MODEL,
+            messages=something._chat_messages(records),
+            max_tokens=something.LLM_MAX_TOKENS,
+            temperature=something.LLM_TEMPERATURE,
+            **params,
+        )
+    record_llm_usage(response.usage)
+    raw_text = response.choices[0].message.content
+
+    if cache is not None and raw_text:
+        cache.set(cache_key, raw_text)
+    return raw_text
+
+
+async def _assess_chunk_async(llm, records):
+    # Same contract as something._assess_chunk, but a chunk without any
+    # valid answer yields Nones (to be re-asked) instead of raising.
+    raw_text = await _complete_async(llm, records)
+    names = [r["neighbourhood"] for r in records]
+    try:
+        valid = parse_assessments(raw_text, names)
+    except ValueError:
+        valid = {}
+    if len(valid) < len(names) and something.RESPONSE_CACHE is not None:
+        something.RESPONSE_CACHE.delete(something._cache_key(records))
+    return [valid.get(name) for name in names]
+
+
+async def _assess_async(llm, records):
+    results = await asyncio.gather(*(
+        _assess_chunk_async(llm, chunk) for chunk in split_records(records)
+    ))
+    return [a for chunk in results for a in chunk]
+
+
+async def generate_neighbourhood_safety_json_async(llm, articles, emoji_table, emoji_ratio=None,
+                                                   fast=False):
+    """
+    Async ``generate_neighbourhood_safety_json`` (same RESPONSE_CACHE,
+    ASSESSMENT_CACHE, chunking, re-asks and local scores; chunks run
+    concurrently on the event loop).
+    """
+    with stage("emoji_stats"):
+        records = await asyncio.to_thread(something.build_safety_records,
+                                          articles, emoji_table, emoji_ratio)
+    if fast:
+        with stage("local_scoring"):
+            return [a.to_dict() for a in local_assessments(records)]
+
+    assessments = await asyncio.to_thread(something._reuse_assessments, records)
+    changed = [r for r, a in zip(records, assessments) if a is None]
+
+    reask_attempts = something.REASK_ATTEMPTS
+    if changed:
+        try:
+            fresh = iter(await _assess_async(llm, changed))
+            assessments = [a if a is not None else next(fresh) for a in assessments]
+        except Exception as e:
+            print(f"⚠️ LLM assessment failed, answering with local scores: {e!r}")
+            reask_attempts = 0  # the model is down; don't ask again
+    for _ in range(reask_attempts):
+        missing = [r for r, a in zip(records, assessments) if a is None]
+        if not missing:
+            break
+        print(f"🔁 Re-asking for {len(missing)} neighbourhood(s): "
+              f"{[r['neighbourhood'] for r in missing]}")
+        try:
+            retried = iter(await _assess_async(llm, missing))
+        except Exception as e:
+            print(f"⚠️ Re-ask failed: {e!r}")
+            break
+        assessments = [a if a is not None else next(retried) for a in assessments]
+
+    await asyncio.to_thread(something._store_assessments, records, assessments)
+    if something.LOCAL_SCORES or None in assessments:
+        with stage("local_scoring"):
+            assessments = something.apply_local_scores(records, assessments,
+                                                       override=something.LOCAL_SCORES)
+    return [a.to_dict() for a in assessments if a is not None]
+
+
+async def send_to_external_api_async(client, url: str, data):
+    payload = {"city_info": data}
+    with stage("external_api"):
+        response = await client.post(url, json=payload)
+    if response.status_code != 200:
+        raise Exception(f"Failed to send data to external API: {response.status_code}")
+    return response
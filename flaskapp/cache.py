@@ -0,0 +1,304 @@
+# cache.py
+#
+# Small caching layer used by the backend:
+#   - LRUCache      : in-process, bounded, per-entry TTL
+#   - SQLiteCache   : on-disk, survives restarts, shareable between workers
+#   - HttpCache     : per-source TTLs + ETag / Last-Modified revalidation
+#
+# Expired entries are kept (until evicted) so their validators can be used
+# for a conditional GET; `get` never returns them as a hit.
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+
+class CacheEntry:
+    __slots__ = ("value", "expires_at", "etag", "last_modified", "stored_at")
+
+    def __init__(self, value, expires_at=None, etag=None, last_modified=None, stored_at=None):
+        self.value = value
+        self.expires_at = expires_at          # epoch seconds, None = never
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = time.time() if stored_at is None else stored_at
+
+    def is_fresh(self, now=None):
+        return self.expires_at is None or (now or time.time()) < self.expires_at
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0  # expired entries refreshed by a 304
+
+    def incr(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "revalidations": self.revalidations,
+            }
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache.
+
+    - max_entries: entries beyond this are evicted least-recently-used first
+    - ttl: default time-to-live in seconds (None = no expiry)
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key):
+        """Returns the entry for `key` even if it has expired, or None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        if entry is None or not entry.is_fresh():
+            self.stats.incr("misses")
+            return default
+        self.stats.incr("hits")
+        return entry.value
+
+    def set(self, key, value, ttl: float = None, etag=None, last_modified=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        entry = CacheEntry(value, expires_at, etag, last_modified)
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self.stats.incr("evictions", evicted)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk cache with the same interface as LRUCache, backed by one SQLite
+    file. Several processes can point at the same file.
+
+    Values are pickled, so only use it for data the backend produced itself.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000, ttl: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key           TEXT PRIMARY KEY,
+                value         BLOB NOT NULL,
+                expires_at    REAL,
+                etag          TEXT,
+                last_modified TEXT,
+                stored_at     REAL NOT NULL,
+                accessed_at   REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+        self._conn.commit()
+
+    def get_entry(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, etag, last_modified, stored_at FROM cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        value, expires_at, etag, last_modified, stored_at = row
+        return CacheEntry(pickle.loads(value), expires_at, etag, last_modified, stored_at)
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        if entry is None or not entry.is_fresh():
+            self.stats.incr("misses")
+            return default
+        self.stats.incr("hits")
+        return entry.value
+
+    def set(self, key, value, ttl: float = None, etag=None, last_modified=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, blob, expires_at, etag, last_modified, now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            evicted = max(0, count - self.max_entries)
+            if evicted:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (evicted,),
+                )
+            self._conn.commit()
+        if evicted:
+            self.stats.incr("evictions", evicted)
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+# ----------------------------------------------------------------------
+# HTTP response cache
+# ----------------------------------------------------------------------
+# Time-to-live per upstream source, in seconds
+SOURCE_TTLS = {
+    "hoodmaps": 24 * 3600,   # neighbourhood descriptions barely change
+    "news": 15 * 60,         # Google News RSS
+}
+
+
+class HttpCache:
+    """
+    Caches GET response bodies per source with their own TTL. When a cached
+    entry has expired it is revalidated with If-None-Match /
+    If-Modified-Since, and a 304 simply extends the old body's lifetime.
+    """
+
+    def __init__(self, backend=None, ttls: dict = None):
+        self.backend = backend if backend is not None else LRUCache(max_entries=1024)
+        self.ttls = dict(SOURCE_TTLS, **(ttls or {}))
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _source_stats(self, source):
+        with self._stats_lock:
+            return self._stats.setdefault(source, CacheStats())
+
+    def lookup(self, source: str, url: str):
+        """
+        Cache half of a GET: returns ``(body, validators, entry)``. `body` is
+        the cached body if it is still fresh, else None; `validators` are
+        the conditional request headers to send upstream.
+        """
+        stats = self._source_stats(source)
+        entry = self.backend.get_entry(f"{source}:{url}")
+        if entry is not None and entry.is_fresh():
+            stats.incr("hits")
+            return entry.value, {}, entry
+        stats.incr("misses")
+
+        validators = {}
+        if entry is not None:
+            if entry.etag:
+                validators["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                validators["If-Modified-Since"] = entry.last_modified
+        return None, validators, entry
+
+    def store(self, source: str, url: str, status: int, body: bytes, headers, entry=None) -> bytes:
+        """
+        Records an upstream response (status + headers + body) and returns the
+        body to use: the cached one on a 304, otherwise `body`. The caller is
+        responsible for rejecting error statuses before calling this.
+        """
+        key = f"{source}:{url}"
+        ttl = self.ttls.get(source)
+        if status == 304 and entry is not None:
+            self._source_stats(source).incr("revalidations")
+            self.backend.set(key, entry.value, ttl=ttl,
+                             etag=headers.get("ETag", entry.etag),
+                             last_modified=headers.get("Last-Modified", entry.last_modified))
+            return entry.value
+        self.backend.set(key, body, ttl=ttl,
+                         etag=headers.get("ETag"),
+                         last_modified=headers.get("Last-Modified"))
+        return body
+
+    def get(self, source: str, url: str, headers: dict = None, timeout: float = None,
+            session=None) -> bytes:
+        """Returns the response body for `url`, from cache when possible."""
+        body, validators, entry = self.lookup(source, url)
+        if body is not None:
+            return body
+
+        resp = (session or requests).get(url, headers={**(headers or {}), **validators},
+                                         timeout=timeout)
+        if not (resp.status_code == 304 and entry is not None):
+            resp.raise_for_status()
+        return self.store(source, url, resp.status_code, resp.content, resp.headers, entry)
+
+    def stats(self):
+        with self._stats_lock:
+            sources = {name: s.as_dict() for name, s in self._stats.items()}
+        return {
+            "sources": sources,
+            "entries": len(self.backend),
+            "evictions": self.backend.stats.evictions,
+        }
+
+
+def http_cache_from_env():
+    """
+    Builds the shared HTTP cache. Set BIBBLE_HTTP_CACHE to a file path to use
+    the on-disk SQLite backend instead of the in-process LRU.
+    """
+    path = os.getenv("BIBBLE_HTTP_CACHE")
+    max_entries = int(os.getenv("BIBBLE_HTTP_CACHE_SIZE", "1024"))
+    backend = SQLiteCache(path, max_entries=max_entries) if path else LRUCache(max_entries=max_entries)
+    return HttpCache(backend)
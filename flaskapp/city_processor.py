@@ -1,116 +1,439 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import requests
-import re
-import requests
-import feedparser
-from urllib.parse import quote_plus
-from datetime import datetime, timedelta
-from bs4 import BeautifulSoup  # Import BeautifulSoup for HTML cleaning
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+from urllib.parse import quote_plus, urlsplit
+from cache import http_cache_from_env
+from host_limiter import HostLimiter, retry_after_seconds
+from http_client import session
+import metrics
+from metrics import stage
+from news_query import HeadlineDeduper, NewsQuery, assign_articles, iter_news, summarize_feeds
+from parsing import find_hoodmaps_payload
+from warmup import throttle
 
 
+# Upstream endpoints (module level so they can be pointed at local stubs)
+HOODMAPS_URL = "https://hoodmaps.com/{city}-neighborhood-map"
+GOOGLE_NEWS_RSS_URL = "https://news.google.com/rss/search?q={query}+near+me&hl=en-US&gl=US&ceid=US:en"
 
-def process_city_data(city_lower: str):
-    city_title = city_lower.capitalize()  # Title-case for matching
-    url = f"https://hoodmaps.com/{city_lower}-neighborhood-map"
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (X11; Linux x86_64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/112.0.0.0 Safari/537.36"
-        )
-    }
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    resp.encoding = "utf-8"
-    html = resp.text
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (X11; Linux x86_64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/112.0.0.0 Safari/537.36"
+    )
+}
+
+# Defaults for the concurrent news fan-out
+NEWS_MAX_WORKERS = 8
+NEWS_TIMEOUT = 10.0  # seconds, per RSS request
+
+# Keywords, date window and quota of the per-neighbourhood news queries
+NEWS_QUERY = NewsQuery.from_env()
+
+# Shared cache for HoodMaps pages and RSS feeds (set to None to disable)
+HTTP_CACHE = http_cache_from_env()
+
+# Per-host rate limits, backoff and circuit breakers (set to None to disable)
+HOST_LIMITER = HostLimiter.from_env()
+# Longest wait for a rate-limit token before answering from the cache instead
+# (at most half the request's timeout, see host_max_wait)
+HOST_MAX_WAIT = 10.0
+
+
+def fetch(source: str, url: str, timeout: float = None) -> bytes:
+    """
+    GETs `url` through HTTP_CACHE (if enabled) and returns the raw body.
+    Upstream requests are paced by the warm-up budget and HOST_LIMITER;
+    while the host is throttled or failing, the last known good (expired)
+    cached body is returned instead, and the error is only raised if there
+    is none. The wait for the limiter counts against `timeout`.
+    """
+    validators, entry = {}, None
+    if HTTP_CACHE is not None:
+        body, validators, entry = HTTP_CACHE.lookup(source, url)
+        if body is not None:
+            return body
+
+    throttle(source)
+    limiter = HOST_LIMITER
+    host = urlsplit(url).netloc
+    started = time.monotonic()
+    if limiter is not None and not limiter.acquire(host, max_wait=host_max_wait(timeout)):
+        return last_known_good(source, url, entry, RuntimeError(f"{host} is throttled or unavailable"))
+    if timeout is not None:
+        timeout -= time.monotonic() - started
+    try:
+        resp = session().get(url, headers={**HEADERS, **validators}, timeout=timeout)
+        if not (resp.status_code == 304 and entry is not None):
+            resp.raise_for_status()
+    except requests.HTTPError as e:
+        if limiter is not None:
+            limiter.record(host, status=e.response.status_code,
+                           retry_after=retry_after_seconds(e.response.headers))
+        return last_known_good(source, url, entry, e)
+    except requests.RequestException as e:
+        if limiter is not None:
+            limiter.record(host, error=True)
+        return last_known_good(source, url, entry, e)
+    if resp.status_code != 304 and lost_items(source, resp.content, entry):
+        if limiter is not None:
+            limiter.record(host, error=True)
+        return last_known_good(source, url, entry, RuntimeError(f"{host} returned an empty feed"))
+    if limiter is not None:
+        limiter.record(host, status=resp.status_code)
+
+    if HTTP_CACHE is None:
+        return resp.content
+    return HTTP_CACHE.store(source, url, resp.status_code, resp.content, resp.headers, entry)
+
+
+def host_max_wait(timeout: float = None) -> float:
+    """Longest wait for a rate-limit token: HOST_MAX_WAIT, or half of `timeout`."""
+    return HOST_MAX_WAIT if timeout is None else min(timeout / 2, HOST_MAX_WAIT)
 
-    prefix = f"{city_title} Neighborhood Map:"
-    # capture everything between the tag that contains the prefix and its closing tag
-    pattern = rf"<em[^>]*>\s*{re.escape(prefix)}\s*(.+?)</em>"
-    match = re.search(pattern, html, flags=re.DOTALL | re.IGNORECASE)
-    if not match:
-        print(f"❌ Could not find the “{prefix}” block.")
-        return
 
-    # full comma-separated payload
-    payload = match.group(1).strip()
+def lost_items(source: str, body: bytes, entry) -> bool:
+    """
+    True for a news feed without items while the cached copy (`entry`) had
+    some: Google News answers throttled queries with an empty feed, which
+    is a failure, not a new answer to cache.
+    """
+    return (source == "news" and entry is not None
+            and b"<item" not in body and b"<item" in entry.value)
 
-    list_of_crimes = ["crime"]
 
-    news_list= []
+def last_known_good(source: str, url: str, entry, error: Exception) -> bytes:
+    """The expired cache `entry` for `url` if there is one, else raises `error`."""
+    if entry is None:
+        raise error
+    print(f"⚠️ Serving last known good {source} response for {url}: {error}")
+    return entry.value
+
+
+def fetch_hoodmaps_neighbourhoods(city_lower: str):
+    """
+    Scrapes the HoodMaps page of a city and returns its neighbourhoods as
+    (name, description) pairs in page order, or None if the description
+    block is missing.
+    """
+    city_title = city_lower.capitalize()  # Title-case for matching
+    url = HOODMAPS_URL.format(city=city_lower)
+    with stage("hoodmaps_fetch"):
+        html = fetch("hoodmaps", url).decode("utf-8", errors="replace")
+    with stage("hoodmaps_parse"):
+        return parse_hoodmaps_neighbourhoods(html, city_title)
+
+
+def parse_hoodmaps_neighbourhoods(html: str, city_title: str):
+    """Extracts the (name, description) pairs from a HoodMaps page."""
+    prefix = f"{city_title} Neighborhood Map:"
+    # everything between the tag that contains the prefix and its closing tag
+    # (full comma-separated payload)
+    payload = find_hoodmaps_payload(html, prefix)
+    if payload is None:
+        print(f"❌ Could not find the “{prefix}” block.")
+        return None
 
     # split on commas
     entries = [e.strip() for e in payload.split(",") if e.strip()]
+    neighbourhoods = []
     for entry in entries:
         if ":" in entry:
             name, desc = entry.split(":", 1)
+            neighbourhoods.append((name.strip(), desc.strip()))
+    return neighbourhoods
+
+
+def process_city_data(city_lower: str, concurrent: bool = True,
+                      max_workers: int = NEWS_MAX_WORKERS,
+                      timeout: float = NEWS_TIMEOUT,
+                      query: NewsQuery = None,
+                      executor=None):
+    """
+    Scrapes the HoodMaps descriptions for a city and attaches the news
+    headlines of every neighbourhood.
+
+    - concurrent: fetch the per-neighbourhood RSS feeds on a thread pool
+      instead of one after the other
+    - max_workers: maximum number of RSS requests in flight at once
+    - timeout: per-request timeout (seconds) for the RSS fetches; a feed
+      that is slower than this, or fails, gets an empty ``news`` list
+    - query: keywords, date window, quota and batching of the news
+      (NEWS_QUERY by default); in batched mode the few city-wide feeds are
+      always fetched concurrently
+    - executor: thread pool to fetch the feeds on, shared with other cities
+      (see pipeline.iter_assess_cities); a pool of `max_workers` is made
+      for this city if None
+
+    Results are always returned in HoodMaps order.
+    """
+    city_title = city_lower.capitalize()
+    neighbourhoods = fetch_hoodmaps_neighbourhoods(city_lower)
+    if neighbourhoods is None:
+        return
+
+    query = query or NEWS_QUERY
+    seen = _city_deduper(query)
+
+    names = [name for name, _ in neighbourhoods]
+    if query.batch != "off":
+        news = fetch_news_batched(names, city_title, query, max_workers=max_workers,
+                                  timeout=timeout, seen=seen, executor=executor)
+    elif concurrent:
+        news = fetch_news_concurrently(names, city_title, query, max_workers=max_workers,
+                                       timeout=timeout, seen=seen, executor=executor)
+    else:
+        news = [_safe_news(name, city_title, query, timeout, seen) for name in names]
+
+    news_list = []
+    for (name, desc), summaries in zip(neighbourhoods, news):
+        neighbour_info = {
+            "neighbourhood": name,
+            "description": desc,
+            "news": summaries
+        }
+        news_list.append(neighbour_info)
 
-            neighbour_info = {
-                "neighbourhood": name.strip(),
-                "description": desc.strip(),
-                "news": news_per_neighborhood(name.strip(), city_title, list_of_crimes)
-            }
-            news_list.append(neighbour_info)
-        
     return news_list
 
-def news_per_neighborhood(neighborhood, city, keywords):
-    start_date = None  # Optional, format YYYY-MM-DD
-    end_date = None  # Optional, format YYYY-MM-DD
-    # Combine neighborhood, city, and keywords into a single query
-    query = f"{neighborhood} {city} " + " ".join(keywords)
 
-    # URL encode the query to ensure spaces are properly handled
-    encoded_query = quote_plus(query)  # Converts spaces to '+', etc.
-    url = f"https://news.google.com/rss/search?q={encoded_query}+near+me&hl=en-US&gl=US&ceid=US:en"
+def iter_city_data(city_lower: str, max_workers: int = NEWS_MAX_WORKERS,
+                   timeout: float = NEWS_TIMEOUT, query: NewsQuery = None):
+    """
+    Streaming counterpart of ``process_city_data``: yields
+    ``(index, neighbour_info)`` as soon as each neighbourhood's news is in
+    (`index` is the HoodMaps position). With dedup on, that is once the
+    neighbourhoods before it are in as well, so duplicates are dropped as
+    in process_city_data; without, in completion order. Yields nothing if
+    the HoodMaps block is missing.
+    """
+    city_title = city_lower.capitalize()
+    neighbourhoods = fetch_hoodmaps_neighbourhoods(city_lower)
+    if not neighbourhoods:
+        return
+
+    query = query or NEWS_QUERY
+    seen = _city_deduper(query)
+
+    if query.batch != "off":
+        # All neighbourhoods come out of the same few feeds, so they finish together
+        names = [name for name, _ in neighbourhoods]
+        news = fetch_news_batched(names, city_title, query,
+                                  max_workers=max_workers, timeout=timeout, seen=seen)
+        for i, ((name, desc), summaries) in enumerate(zip(neighbourhoods, news)):
+            yield i, {"neighbourhood": name, "description": desc, "news": summaries}
+        return
+
+    # Feeds are fetched concurrently but deduplicated in HoodMaps order, so
+    # with dedup on a neighbourhood is yielded once all before it are in
+    contents = {}
+    next_index = 0
+
+    def parsed(i):
+        content = contents.pop(i)
+        name, desc = neighbourhoods[i]
+        with stage("news_parse"):
+            news = [] if content is None else summaries_from_feed(content, query, seen)
+        return i, {"neighbourhood": name, "description": desc, "news": news}
+
+    workers = max(1, min(max_workers, len(neighbourhoods)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            metrics.submit(executor, _safe_feed, news_query_url(name, city_title, query.keywords),
+                           timeout): i
+            for i, (name, _) in enumerate(neighbourhoods)
+        }
+        pending = set(futures)
+        waves = -(-len(futures) // workers)
+        try:
+            for future in as_completed(futures, timeout=timeout * waves):
+                pending.discard(future)
+                i = futures[future]
+                contents[i] = future.result()
+                if seen is None:
+                    yield parsed(i)
+                while next_index in contents:
+                    yield parsed(next_index)
+                    next_index += 1
+        except FuturesTimeout:
+            pass
+        # Whatever missed the deadline is reported without news
+        for future in pending:
+            contents[futures[future]] = None
+        for i in sorted(contents):
+            yield parsed(i)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _gather(calls, max_workers: int, timeout: float, executor=None) -> list:
+    """
+    Runs every ``(fn, *args)`` of `calls` on `executor` (or on a pool of
+    `max_workers` made for the occasion) and returns the results in order,
+    None for calls that have not finished once the deadline has passed.
+    """
+    if executor is not None:
+        return _gather_shared(calls, timeout, executor)
+    workers = max(1, min(max_workers, len(calls)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [metrics.submit(executor, *call) for call in calls]
+        # Every request gets `timeout` seconds, but they run in waves of
+        # `max_workers`, so the deadline for the whole batch scales with that.
+        waves = -(-len(futures) // workers)
+        done, _ = wait(futures, timeout=timeout * waves)
+        return [f.result() if f in done else None for f in futures]
+    finally:
+        # Don't let a stalled feed hold up the response
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    # Parse the RSS feed
-    feed = feedparser.parse(url)
 
-    # Parse the date range (if any)
-    if start_date:
-        start_date = datetime.strptime(start_date, "%Y-%m-%d")
-    if end_date:
-        end_date = datetime.strptime(end_date, "%Y-%m-%d")
+def _gather_shared(calls, timeout: float, executor) -> list:
+    """
+    ``_gather`` on a pool shared with other cities: calls may queue behind
+    theirs, so each call's `timeout` only starts once it is running.
+    """
+    started = {}
 
-    # List to collect summaries
-    summaries = []
+    def run(i, fn, *args):
+        started[i] = time.monotonic()
+        return fn(*args)
 
-    i = 0
+    futures = [metrics.submit(executor, run, i, *call) for i, call in enumerate(calls)]
+    results = [None] * len(futures)
+    pending = dict(enumerate(futures))
+    try:
+        while pending:
+            for i in [i for i, f in pending.items() if f.done()]:
+                results[i] = pending.pop(i).result()
+            now = time.monotonic()
+            for i in [i for i in pending if i in started and now >= started[i] + timeout]:
+                del pending[i]   # running past its deadline: given up on
+            if not pending:
+                break
+            # Queued calls have no deadline yet; look again every `timeout`
+            deadlines = [started[i] + timeout for i in pending if i in started]
+            wake = min(deadlines, default=now + timeout) - now
+            wait(list(pending.values()), timeout=max(wake, 0.0), return_when=FIRST_COMPLETED)
+        return results
+    finally:
+        for f in futures:
+            f.cancel()
 
-    # Process each entry in the feed
-    for entry in feed.entries:
-        i += 1
-        if i > 15:
-            break
-        # Convert published date to datetime
-        published_date = datetime.strptime(entry.published, "%a, %d %b %Y %H:%M:%S %Z")
 
-        # Filter by date range
-        if start_date and published_date < start_date:
-            continue
-        if end_date and published_date > end_date:
-            continue
+def fetch_news_concurrently(neighborhoods, city, query: NewsQuery,
+                            max_workers: int = NEWS_MAX_WORKERS,
+                            timeout: float = NEWS_TIMEOUT,
+                            seen: HeadlineDeduper = None,
+                            executor=None):
+    """
+    Fetches the feed of every neighbourhood on a thread pool (`executor`, or
+    one of `max_workers` threads), then parses them in order with
+    ``summarize_feeds`` so duplicates are dropped the same way every run.
 
-        # Extract summary or content (the text of the article)
-        text = entry.summary if 'summary' in entry else "No summary available"
-        
-        # Clean HTML from the summary text
-        clean_text = BeautifulSoup(text, "html.parser").get_text()
+    Returns one list of summaries per neighbourhood, in the order the
+    neighbourhoods were given. Feeds that fail, or that have not finished
+    once the overall deadline has passed, degrade to an empty list.
+    """
+    if not neighborhoods:
+        return []
 
-        # Add the cleaned summary to the list
-        summaries.append(clean_text)
+    calls = [(_safe_feed, news_query_url(name, city, query.keywords), timeout)
+             for name in neighborhoods]
+    contents = _gather(calls, max_workers, timeout, executor)
+    with stage("news_parse"):
+        return summarize_feeds(contents, query, seen)
 
-    return summaries  # Return the list of summaries
 
+def fetch_news_batched(neighborhoods, city, query: NewsQuery,
+                       max_workers: int = NEWS_MAX_WORKERS,
+                       timeout: float = NEWS_TIMEOUT,
+                       seen: HeadlineDeduper = None,
+                       executor=None):
+    """
+    Batched counterpart of ``fetch_news_concurrently``: fetches the few
+    feeds of ``news_batch_urls`` and assigns their articles to the
+    neighbourhoods they mention. Same return value; a feed that fails or
+    misses the deadline only leaves its neighbourhoods short of news.
+    """
+    if not neighborhoods:
+        return []
 
+    calls = [(_safe_feed, url, timeout) for url in news_batch_urls(neighborhoods, city, query)]
+    contents = _gather(calls, max_workers, timeout, executor)
+
+    with stage("news_parse"):
+        return assign_articles(contents, neighborhoods, query, seen)
+
+
+def _safe_feed(url, timeout):
+    try:
+        with stage("news_fetch"):
+            return fetch("news", url, timeout=timeout)
+    except Exception as e:
+        print(f"⚠️ News fetch failed for {url}: {e}")
+        return None
+
+
+def _city_deduper(query: NewsQuery):
+    # One deduper per city run, shared by all of its neighbourhoods
+    return HeadlineDeduper() if query.dedup else None
+
+
+def _safe_news(neighborhood, city, query, timeout, seen=None):
+    try:
+        return news_per_neighborhood(neighborhood, city, query, timeout=timeout, seen=seen)
+    except Exception as e:
+        print(f"⚠️ News fetch failed for {neighborhood}: {e}")
+        return []
+
+
+def news_query_url(neighborhood, city, keywords):
+    # Combine neighborhood, city, and keywords into a single query
+    query = f"{neighborhood} {city} " + " ".join(keywords)
+
+    # URL encode the query to ensure spaces are properly handled
+    encoded_query = quote_plus(query)  # Converts spaces to '+', etc.
+    return GOOGLE_NEWS_RSS_URL.format(query=encoded_query)
 
-    
 
+def news_batch_urls(neighborhoods, city, query: NewsQuery):
+    """
+    Feed URLs of a batched query: one per `group_size` neighbourhoods with
+    their names OR-ed together, or a single city-level one.
+    """
+    keywords = " ".join(query.keywords)
+    if query.batch == "city":
+        terms = [f"{city} {keywords}"]
+    else:
+        terms = [
+            "(" + " OR ".join(f'"{name}"' for name in neighborhoods[i:i + query.group_size])
+            + f") {city} {keywords}"
+            for i in range(0, len(neighborhoods), query.group_size)
+        ]
+    return [GOOGLE_NEWS_RSS_URL.format(query=quote_plus(term.strip())) for term in terms]
 
 
+def news_per_neighborhood(neighborhood, city, query: NewsQuery = None, timeout=None,
+                          seen: HeadlineDeduper = None):
+    query = query or NEWS_QUERY
+    url = news_query_url(neighborhood, city, query.keywords)
 
+    # Fetch the RSS feed (with requests, so it can time out)
+    with stage("news_fetch"):
+        content = fetch("news", url, timeout=timeout)
+    with stage("news_parse"):
+        return summaries_from_feed(content, query, seen)
 
 
-   
\ No newline at end of file
+def summaries_from_feed(content, query: NewsQuery = None, seen: HeadlineDeduper = None):
+    """
+    Cleaned summaries of a raw RSS document: the first ``query.max_items``
+    in-window entries whose headline is not in `seen` (see news_query.py).
+    """
+    return list(iter_news(content, query or NEWS_QUERY, seen))
@@ -0,0 +1,274 @@
+# delivery.py
+#
+# Fire-and-forget delivery of payloads to the external API.
+#
+# Requests only put their payload on a DeliveryQueue and return; one
+# background thread takes up to `max_batch` payloads every `flush_interval`
+# seconds, posts them together and retries a failed batch with exponential
+# backoff. Pending payloads live in memory, or in a SQLite spool file
+# (SQLiteSpool) so they survive a restart and can be shared by workers.
+#
+# Reported on /metrics:
+#   bibble_queue_depth{queue="external"}                    payloads waiting
+#   bibble_stage_duration_seconds{stage="external_delivery"}  enqueue -> delivered
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import metrics
+
+
+class MemorySpool:
+    """Pending payloads of one process, oldest first."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = deque()      # (id, payload, enqueued_at)
+        self._in_flight = {}       # id -> item
+        self._next_id = 0
+
+    def put(self, payload, enqueued_at: float):
+        with self._lock:
+            self._next_id += 1
+            self._items.append((self._next_id, payload, enqueued_at))
+
+    def take(self, n: int) -> list:
+        with self._lock:
+            batch = [self._items.popleft() for _ in range(min(n, len(self._items)))]
+            self._in_flight.update((item[0], item) for item in batch)
+            return batch
+
+    def ack(self, ids):
+        with self._lock:
+            for i in ids:
+                self._in_flight.pop(i, None)
+
+    def release(self, ids):
+        """Puts taken payloads back at the front, in their original order."""
+        with self._lock:
+            items = [self._in_flight.pop(i) for i in ids if i in self._in_flight]
+            self._items.extendleft(reversed(items))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items) + len(self._in_flight)
+
+
+class SQLiteSpool:
+    """
+    Pending payloads in a SQLite file. Taken payloads are leased, so several
+    workers can drain the same spool; a lease that is not acked within
+    `lease` seconds (e.g. the worker died) makes the payload available again.
+    """
+
+    def __init__(self, path: str, lease: float = 300.0):
+        self.path = path
+        self.lease = lease
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload     TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                leased_at   REAL
+            )
+            """
+        )
+
+    def put(self, payload, enqueued_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (payload, enqueued_at) VALUES (?, ?)",
+                (json.dumps(payload, ensure_ascii=False), enqueued_at),
+            )
+
+    def take(self, n: int) -> list:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload, enqueued_at FROM outbox "
+                    "WHERE leased_at IS NULL OR leased_at < ? ORDER BY id LIMIT ?",
+                    (now - self.lease, n),
+                ).fetchall()
+                self._conn.executemany("UPDATE outbox SET leased_at = ? WHERE id = ?",
+                                       [(now, row[0]) for row in rows])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(i, json.loads(payload), enqueued_at) for i, payload, enqueued_at in rows]
+
+    def ack(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def release(self, ids):
+        with self._lock:
+            self._conn.executemany("UPDATE outbox SET leased_at = NULL WHERE id = ?",
+                                   [(i,) for i in ids])
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+class DeliveryQueue:
+    """
+    Sends payloads through ``send(body)`` (which raises on failure) from a
+    background thread.
+
+    - flush_interval: seconds between two batches
+    - max_batch: payloads per request; with 1 each payload is sent as is,
+      otherwise as ``{"batch": [payload, ...]}``
+    - max_retries / backoff / max_backoff: a failed batch is retried after
+      backoff, 2 * backoff, ... (at most max_backoff) seconds, then dropped
+    - max_pending: payloads submitted beyond this are dropped
+    - spool: MemorySpool (default) or SQLiteSpool
+    """
+
+    def __init__(self, send, flush_interval: float = 1.0, max_batch: int = 20,
+                 max_retries: int = 5, backoff: float = 0.5, max_backoff: float = 30.0,
+                 max_pending: int = 10_000, spool=None, name: str = "external"):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.send = send
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        self.spool = spool if spool is not None else MemorySpool()
+        self.name = name
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "delivered": 0, "dropped": 0, "batches": 0, "retries": 0}
+
+    @classmethod
+    def from_env(cls, send):
+        """
+        Configured from BIBBLE_EXTERNAL_FLUSH_INTERVAL, BIBBLE_EXTERNAL_BATCH,
+        BIBBLE_EXTERNAL_RETRIES and BIBBLE_EXTERNAL_SPOOL (SQLite file to keep
+        pending payloads across restarts).
+        """
+        path = os.getenv("BIBBLE_EXTERNAL_SPOOL")
+        return cls(
+            send,
+            flush_interval=float(os.getenv("BIBBLE_EXTERNAL_FLUSH_INTERVAL", 1.0)),
+            max_batch=int(os.getenv("BIBBLE_EXTERNAL_BATCH", 20)),
+            max_retries=int(os.getenv("BIBBLE_EXTERNAL_RETRIES", 5)),
+            spool=SQLiteSpool(path) if path else None,
+        )
+
+    # ------------------------------------------------------------------
+    # producer side
+    # ------------------------------------------------------------------
+    def submit(self, payload) -> bool:
+        """Queues `payload` (JSON-serialisable); False if the queue is full."""
+        depth = len(self.spool)
+        if depth >= self.max_pending:
+            print(f"⚠️ {self.name} delivery queue full ({depth}), dropping payload")
+            self._incr("dropped")
+            return False
+        self.spool.put(payload, time.time())
+        self._incr("submitted")
+        metrics.set_queue_depth(self.name, depth + 1)
+        if depth + 1 >= self.max_batch:
+            self._wake.set()
+        return True
+
+    def depth(self) -> int:
+        return len(self.spool)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"depth": self.depth(), **self._stats}
+
+    def _incr(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    # ------------------------------------------------------------------
+    # background thread
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._work_loop,
+                                            name=f"{self.name}-delivery", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Stops the thread after one last flush (bounded by `timeout`)."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush(retry=False)
+
+    def flush(self, retry: bool = True):
+        """Sends everything pending, one batch at a time."""
+        while True:
+            batch = self.spool.take(self.max_batch)
+            if not batch:
+                break
+            if not self._send_batch(batch, retry):
+                break
+        metrics.set_queue_depth(self.name, len(self.spool))
+
+    def _send_batch(self, batch, retry: bool) -> bool:
+        ids = [item[0] for item in batch]
+        payloads = [item[1] for item in batch]
+        body = payloads[0] if self.max_batch == 1 else {"batch": payloads}
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            if attempt:
+                self._incr("retries")
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+                if self._stop.wait(delay):
+                    break  # shutting down: keep the batch for later
+            try:
+                self.send(body)
+            except Exception as e:
+                print(f"⚠️ {self.name} delivery of {len(batch)} payload(s) failed "
+                      f"(attempt {attempt + 1}): {e}")
+                continue
+            self.spool.ack(ids)
+            now = time.time()
+            for _, _, enqueued_at in batch:
+                metrics.observe(f"{self.name}_delivery", now - enqueued_at)
+            self._incr("delivered", len(batch))
+            self._incr("batches")
+            return True
+
+        if self._stop.is_set() or not retry:
+            # A spool keeps them for the next start; in memory they are lost
+            self.spool.release(ids)
+            return False
+        print(f"❌ Dropping {len(batch)} {self.name} payload(s) after {attempts} attempts")
+        self.spool.ack(ids)
+        now = time.time()
+        for _, _, enqueued_at in batch:
+            metrics.observe(f"{self.name}_delivery", now - enqueued_at, failed=True)
+        self._incr("dropped", len(batch))
+        return True
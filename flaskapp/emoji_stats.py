@@ -0,0 +1,93 @@
+# emoji_stats.py
+#
+# Vectorized statistics over the emoji reaction table used to build the
+# LLM input in something.py. Every function does a constant number of
+# passes over the table (no per-group Python callbacks, no per-place
+# queries), so cost grows linearly with the number of rows. Columns are
+# read in place, so a zero-copy city slice of an EmojiTable (compact
+# categorical keys, uint16/uint32 counts) is never copied.
+
+import numpy as np
+import pandas as pd
+
+
+def emoji_columns(df: pd.DataFrame) -> list:
+    """All emoji count columns (emoji_1 … emoji_N)."""
+    return [c for c in df.columns if "emoji_" in c]
+
+
+def _group_codes(keys: pd.Series):
+    """
+    ``(codes, labels)`` for a key column: the categorical codes as they are
+    (no copy) for a compact table, pd.factorize otherwise.
+    """
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        return keys.array.codes, keys.cat.categories
+    return pd.factorize(keys)
+
+
+def compute_emoji4_ratio(df: pd.DataFrame) -> pd.Series:
+    """
+    Reaction-weighted share of Emoji 4 per neighbourhood:
+
+        sum(ratio_i * total_i) / sum(total_i),  ratio_i = emoji_4 / max(total_i, 1)
+
+    Since ratio_i * total_i is just emoji_4 (both are 0 when total_i is 0),
+    this is sum(emoji_4) / sum(total) per neighbourhood: one bincount per
+    emoji column, reading the columns in place.
+    """
+    codes, labels = _group_codes(df["neighbourhood"])
+    valid = codes >= 0
+    if not valid.all():
+        codes = codes[valid]
+    size = len(labels)
+
+    def column_sums(column):
+        values = df[column].to_numpy()
+        return np.bincount(codes, weights=values if valid.all() else values[valid], minlength=size)
+
+    emoji4 = column_sums("emoji_4")
+    total = sum(column_sums(c) for c in emoji_columns(df))
+    present = np.bincount(codes, minlength=size) > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = emoji4[present] / total[present]
+    return pd.Series(ratio, index=pd.Index(labels[present])).sort_index()
+
+
+def top_places_with_counts(df: pd.DataFrame, n: int = 3) -> dict:
+    """
+    Top `n` places by Emoji 4 count per neighbourhood, with their counts:
+
+        {"<neighbourhood>": [{"place": "<name>", "emoji4": <int>}, ...]}
+
+    One lexsort by (neighbourhood, emoji_4 descending) over the columns in
+    place; ties keep table order, and neighbourhoods come out ordered by
+    their best count, as with a stable sort on emoji_4.
+    """
+    if df.empty:
+        return {}
+    codes, labels = _group_codes(df["neighbourhood"])
+    emoji4 = df["emoji_4"].to_numpy().astype(np.int64)
+
+    order = np.lexsort((-emoji4, codes))
+    sorted_codes = codes[order]
+    positions = np.arange(len(order))
+    starts = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    rank = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    top = order[(rank < n) & (sorted_codes >= 0)]
+    top = top[np.lexsort((top, -emoji4[top]))]
+
+    result = {}
+    for nbh, place, count in zip(labels.take(codes[top]).tolist(),
+                                 df["place"].iloc[top].tolist(),
+                                 emoji4[top].tolist()):
+        result.setdefault(nbh, []).append({"place": place, "emoji4": int(count)})
+    return result
+
+
+def top_safe_places(df: pd.DataFrame, n: int = 3) -> dict:
+    """Top `n` place names by Emoji 4 count per neighbourhood."""
+    return {
+        nbh: [p["place"] for p in places]
+        for nbh, places in top_places_with_counts(df, n).items()
+    }
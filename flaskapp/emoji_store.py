@@ -0,0 +1,211 @@
+# emoji_store.py
+#
+# Persistent emoji-reaction store (SQLite).
+#
+#   reactions             one row per (city, neighbourhood, place)
+#   neighbourhood_totals  running total reactions + emoji_4 sum per
+#                         (city, neighbourhood), kept up to date by triggers
+#
+# The store is opened once at startup; requests read a city-filtered slice
+# through the (city, neighbourhood, place) primary key, and new reactions
+# are upserted without rebuilding anything. Slices come back compact
+# (categorical keys, uint16/uint32 counts; see emoji_table.py), and
+# snapshot() loads the whole store into a read-only EmojiTable.
+
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from emoji_table import EmojiTable, compact_frame, concat_compact
+
+
+EMOJI_COLUMNS = [f"emoji_{i}" for i in range(1, 6)]
+KEY_COLUMNS = ["city", "neighbourhood", "place"]
+
+_TOTAL_EXPR = " + ".join(EMOJI_COLUMNS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reactions (
+    city          TEXT NOT NULL COLLATE NOCASE,
+    neighbourhood TEXT NOT NULL,
+    place         TEXT NOT NULL,
+    {", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in EMOJI_COLUMNS)},
+    PRIMARY KEY (city, neighbourhood, place)
+);
+
+CREATE TABLE IF NOT EXISTS neighbourhood_totals (
+    city          TEXT NOT NULL COLLATE NOCASE,
+    neighbourhood TEXT NOT NULL,
+    total         INTEGER NOT NULL DEFAULT 0,
+    emoji_4       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (city, neighbourhood)
+);
+
+CREATE TRIGGER IF NOT EXISTS reactions_ai AFTER INSERT ON reactions BEGIN
+    INSERT INTO neighbourhood_totals (city, neighbourhood, total, emoji_4)
+    VALUES (NEW.city, NEW.neighbourhood, {_TOTAL_EXPR.replace("emoji_", "NEW.emoji_")}, NEW.emoji_4)
+    ON CONFLICT (city, neighbourhood) DO UPDATE SET
+        total   = total   + excluded.total,
+        emoji_4 = emoji_4 + excluded.emoji_4;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reactions_ad AFTER DELETE ON reactions BEGIN
+    UPDATE neighbourhood_totals SET
+        total   = total   - ({_TOTAL_EXPR.replace("emoji_", "OLD.emoji_")}),
+        emoji_4 = emoji_4 - OLD.emoji_4
+    WHERE city = OLD.city AND neighbourhood = OLD.neighbourhood;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reactions_au AFTER UPDATE ON reactions BEGIN
+    UPDATE neighbourhood_totals SET
+        total   = total   - ({_TOTAL_EXPR.replace("emoji_", "OLD.emoji_")}),
+        emoji_4 = emoji_4 - OLD.emoji_4
+    WHERE city = OLD.city AND neighbourhood = OLD.neighbourhood;
+    INSERT INTO neighbourhood_totals (city, neighbourhood, total, emoji_4)
+    VALUES (NEW.city, NEW.neighbourhood, {_TOTAL_EXPR.replace("emoji_", "NEW.emoji_")}, NEW.emoji_4)
+    ON CONFLICT (city, neighbourhood) DO UPDATE SET
+        total   = total   + excluded.total,
+        emoji_4 = emoji_4 + excluded.emoji_4;
+END;
+"""
+
+_UPSERT = f"""
+INSERT INTO reactions ({", ".join(KEY_COLUMNS + EMOJI_COLUMNS)})
+VALUES ({", ".join("?" for _ in KEY_COLUMNS + EMOJI_COLUMNS)})
+ON CONFLICT (city, neighbourhood, place) DO UPDATE SET
+    {", ".join(f"{c} = excluded.{c}" for c in EMOJI_COLUMNS)}
+"""
+
+_ADD = f"""
+INSERT INTO reactions ({", ".join(KEY_COLUMNS + EMOJI_COLUMNS)})
+VALUES ({", ".join("?" for _ in KEY_COLUMNS + EMOJI_COLUMNS)})
+ON CONFLICT (city, neighbourhood, place) DO UPDATE SET
+    {", ".join(f"{c} = {c} + excluded.{c}" for c in EMOJI_COLUMNS)}
+"""
+
+
+def _count(value) -> int:
+    """A reaction count as int; raises ValueError unless it is a whole number >= 0."""
+    number = float(value)
+    if number < 0 or not number.is_integer():
+        raise ValueError(f"emoji counts must be non-negative whole numbers, got {value!r}")
+    return int(number)
+
+
+class EmojiStore:
+    """
+    Emoji reactions per place, indexed by city and neighbourhood.
+
+    - path: SQLite file (":memory:" keeps everything in-process)
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Opens the store at BIBBLE_EMOJI_DB, or an in-memory one."""
+        return cls(os.getenv("BIBBLE_EMOJI_DB", ":memory:"))
+
+    # ------------------------------------------------------------------
+    # writes
+    # ------------------------------------------------------------------
+    def upsert(self, rows, accumulate: bool = False) -> int:
+        """
+        Inserts or replaces reactions. `rows` is a DataFrame or an iterable
+        of dicts with city / neighbourhood / place and emoji_N counts.
+
+        With accumulate=True the counts are added to the stored ones instead
+        of replacing them (i.e. `rows` holds new reactions, not totals).
+        Missing or null counts are 0; a count that is not a non-negative
+        whole number raises ValueError or TypeError, and nothing is written.
+        Returns the number of rows written.
+        """
+        if isinstance(rows, pd.DataFrame):
+            frame = rows
+        else:
+            frame = pd.DataFrame(list(rows))
+        if frame.empty:
+            return 0
+        # Rows may name different emoji_N keys (or send null): missing counts are 0
+        frame = frame.assign(**{
+            c: frame[c].fillna(0) if c in frame.columns else 0 for c in EMOJI_COLUMNS
+        })
+        values = frame[KEY_COLUMNS + EMOJI_COLUMNS].itertuples(index=False, name=None)
+        values = [
+            tuple(str(v) for v in row[:3]) + tuple(_count(v) for v in row[3:])
+            for row in values
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(_ADD if accumulate else _UPSERT, values)
+        return len(values)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM reactions LIMIT 1").fetchone() is None
+
+    # ------------------------------------------------------------------
+    # reads
+    # ------------------------------------------------------------------
+    def city_slice(self, city: str) -> pd.DataFrame:
+        """All reactions of one city (case-insensitive), via the primary key."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(KEY_COLUMNS + EMOJI_COLUMNS)} FROM reactions WHERE city = ?",
+                (city,),
+            )
+            rows = cursor.fetchall()
+        return compact_frame(pd.DataFrame(rows, columns=KEY_COLUMNS + EMOJI_COLUMNS))
+
+    def snapshot(self, batch_rows: int = 100_000, cities=None) -> EmojiTable:
+        """
+        All reactions (or those of `cities` only) as a compact in-memory
+        EmojiTable, read in batches of `batch_rows` (ordered by city, so no
+        re-sort is needed).
+        """
+        frames = []
+        where, params = "", ()
+        if cities is not None:
+            params = tuple(cities)
+            where = f" WHERE city IN ({', '.join('?' * len(params))})"
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(KEY_COLUMNS + EMOJI_COLUMNS)} FROM reactions{where} ORDER BY city",
+                params,
+            )
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                frames.append(compact_frame(pd.DataFrame(rows, columns=KEY_COLUMNS + EMOJI_COLUMNS)))
+        if not frames:
+            return EmojiTable(compact_frame(pd.DataFrame(columns=KEY_COLUMNS + EMOJI_COLUMNS)))
+        return EmojiTable.from_frame(concat_compact(frames))
+
+    def emoji4_ratios(self, city: str) -> pd.Series:
+        """
+        Emoji 4 share per neighbourhood of `city`, read from the running
+        totals (same value as emoji_stats.compute_emoji4_ratio on the slice).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT neighbourhood, CAST(emoji_4 AS REAL) / total "
+                "FROM neighbourhood_totals WHERE city = ? AND total > 0",
+                (city,),
+            ).fetchall()
+        return pd.Series(dict(rows), dtype="float64")
+
+    def cities(self) -> list:
+        with self._lock:
+            return [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT city FROM neighbourhood_totals ORDER BY city"
+            )]
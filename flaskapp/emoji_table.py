@@ -0,0 +1,132 @@
+# emoji_table.py
+#
+# Compact, read-only in-memory emoji reaction table.
+#
+#   - city / neighbourhood / place are categoricals (one int code per row,
+#     each distinct name stored once)
+#   - emoji_N counts are uint16, or uint32 if a count does not fit
+#   - rows are grouped by city once at load time, so a city slice is a
+#     contiguous row range: city_slice() returns views, nothing is copied
+#
+# The emoji_stats functions work on it directly (they group on the
+# categorical codes). For live updates use EmojiStore; EmojiStore.snapshot()
+# turns the store into one of these.
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from emoji_stats import compute_emoji4_ratio
+
+KEY_COLUMNS = ["city", "neighbourhood", "place"]
+
+
+def compact_counts(values) -> np.ndarray:
+    """Counts as uint16, or uint32 if the largest one does not fit."""
+    values = np.asarray(values)
+    if values.size and values.min() < 0:
+        raise ValueError("emoji counts must be non-negative")
+    largest = int(values.max()) if values.size else 0
+    if largest <= np.iinfo(np.uint16).max:
+        return values.astype(np.uint16, copy=False)
+    if largest <= np.iinfo(np.uint32).max:
+        return values.astype(np.uint32, copy=False)
+    raise ValueError(f"emoji count {largest} does not fit in uint32")
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with categorical key columns and compact emoji counts (see module
+    docstring). Columns that already have the right dtype are reused as is.
+    """
+    columns = {}
+    for c in df.columns:
+        if c in KEY_COLUMNS:
+            columns[c] = df[c].array if isinstance(df[c].dtype, pd.CategoricalDtype) \
+                else pd.Categorical(df[c])
+        elif c.startswith("emoji_"):
+            columns[c] = compact_counts(df[c].to_numpy())
+        else:
+            columns[c] = df[c].array
+    return pd.DataFrame(columns)
+
+
+def concat_compact(frames) -> pd.DataFrame:
+    """Concatenates compact frames, merging the key categories (union)."""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame()
+    columns = {}
+    for c in frames[0].columns:
+        if c in KEY_COLUMNS:
+            columns[c] = union_categoricals([f[c].array for f in frames])
+        elif c.startswith("emoji_"):
+            columns[c] = compact_counts(np.concatenate([f[c].to_numpy() for f in frames]))
+        else:
+            columns[c] = np.concatenate([f[c].to_numpy() for f in frames])
+    return pd.DataFrame(columns)
+
+
+class EmojiTable:
+    """
+    Emoji reactions of many cities in one compact frame.
+
+        table = EmojiTable.from_frame(generate_synthetic_tourist_data())
+        table.city_slice("Amsterdam")    # zero-copy view of that city's rows
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        """`frame` must already be compact and grouped by city; use from_frame."""
+        self.frame = frame
+        self._ranges = {}   # casefolded city -> (start, stop)
+        if len(frame):
+            codes = frame["city"].array.codes
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            stops = np.r_[starts[1:], len(codes)]
+            names = frame["city"].cat.categories
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                key = str(names[codes[start]]).casefold()
+                if key in self._ranges:
+                    raise ValueError(f"rows of city {names[codes[start]]!r} are not contiguous")
+                self._ranges[key] = (start, stop)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "EmojiTable":
+        """Compacts `df` and groups its rows by city (stable, one sort)."""
+        frame = compact_frame(df)
+        if len(frame):
+            # Case-insensitive, like EmojiStore's COLLATE NOCASE: spellings
+            # of the same city share one category (the first spelling)
+            city = frame["city"].cat.remove_unused_categories()
+            group, _ = pd.factorize(city.cat.categories.str.casefold())
+            names = city.cat.categories[np.unique(group, return_index=True)[1]]
+            codes = group[city.array.codes]
+            frame["city"] = pd.Categorical.from_codes(codes, categories=names)
+            if np.count_nonzero(np.diff(codes)) + 1 != len(names):
+                # some city's rows are not contiguous yet
+                frame = frame.take(np.argsort(codes, kind="stable")).reset_index(drop=True)
+        return cls(frame)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def cities(self) -> list:
+        codes = self.frame["city"].array.codes
+        names = self.frame["city"].cat.categories
+        return [str(names[codes[start]]) for start, _ in self._ranges.values()]
+
+    def city_slice(self, city: str) -> pd.DataFrame:
+        """
+        All rows of one city (case-insensitive) as a view on the table;
+        an empty frame with the same columns if the city is unknown.
+        """
+        start, stop = self._ranges.get(city.casefold(), (0, 0))
+        return self.frame.iloc[start:stop]
+
+    def emoji4_ratios(self, city: str) -> pd.Series:
+        """Emoji 4 share per neighbourhood of `city` (see emoji_stats)."""
+        return compute_emoji4_ratio(self.city_slice(city))
+
+    def memory_usage(self) -> int:
+        """Bytes held by the table (including category names)."""
+        return int(self.frame.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,225 @@
+# host_limiter.py
+#
+# Per-host throttling of the scraped sources (HoodMaps, Google News):
+#
+#   - token bucket per host: `per_minute` requests, bursts of a sixth of that
+#   - adaptive backoff: a 429 / 503 halves the host's rate (down to
+#     MIN_RATE_FACTOR of it) and pauses the host for Retry-After, or an
+#     exponential backoff; every success adds back a tenth of the rate
+#   - circuit breaker: after `failure_threshold` failures in a row (errors,
+#     5xx, or soft failures such as an empty news feed) the host is skipped
+#     for `cooldown` seconds; then one probe request is let through, and a
+#     success closes the circuit again
+#
+# While a host is paused or tripped, city_processor.fetch answers from the
+# last known good copy in HTTP_CACHE instead of failing. The state lives in
+# memory (shared by all threads of a worker) or, with a SQLiteHostStore, in
+# a file shared by every worker process on the machine.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Requests per minute for hosts without their own limit (None = unlimited)
+DEFAULT_PER_MINUTE = None
+HOST_RATE_LIMITS = {
+    "hoodmaps.com": 30,
+    "news.google.com": 120,
+}
+MIN_RATE_FACTOR = 0.1
+BACKOFF = 1.0          # seconds, doubled per failure in a row
+MAX_BACKOFF = 60.0
+THROTTLE_STATUSES = (429, 503)
+
+
+def _initial_state(per_minute: float) -> dict:
+    rate = per_minute / 60.0
+    return {"rate": rate, "tokens": max(per_minute / 6.0, 1.0), "updated": time.time(),
+            "paused_until": 0.0, "open_until": 0.0, "failures": 0}
+
+
+class MemoryHostStore:
+    """Host states of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def update(self, host: str, initial: dict, fn):
+        """Applies ``fn(state) -> result`` to the host's state atomically."""
+        with self._lock:
+            state = self._states.setdefault(host, initial)
+            return fn(state)
+
+
+class SQLiteHostStore:
+    """Host states in a SQLite file, updated in one write transaction each."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Throttling state need not survive a power loss; skip the fsync per update
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, state TEXT NOT NULL)")
+
+    def update(self, host: str, initial: dict, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state FROM hosts WHERE host = ?", (host,)).fetchone()
+                state = json.loads(row[0]) if row else initial
+                result = fn(state)
+                self._conn.execute("INSERT OR REPLACE INTO hosts (host, state) VALUES (?, ?)",
+                                   (host, json.dumps(state)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+
+class HostLimiter:
+    """
+    Token buckets, adaptive backoff and circuit breakers for many hosts.
+
+        wait = limiter.reserve(host)     # 0: go, > 0: retry in `wait` s, None: tripped
+        ...
+        limiter.record(host, status=resp.status_code, retry_after=...)
+    """
+
+    def __init__(self, limits: dict = None, default_per_minute: float = DEFAULT_PER_MINUTE,
+                 failure_threshold: int = 5, cooldown: float = 60.0, store=None):
+        self.limits = dict(HOST_RATE_LIMITS, **(limits or {}))
+        self.default_per_minute = default_per_minute
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.store = store if store is not None else MemoryHostStore()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Configured from BIBBLE_HOST_RATE_LIMITS ("host=per_minute,..."),
+        BIBBLE_HOST_FAILURES, BIBBLE_HOST_COOLDOWN and BIBBLE_HOST_STATE (SQLite
+        file to share the state between worker processes).
+        """
+        limits = {}
+        for item in os.getenv("BIBBLE_HOST_RATE_LIMITS", "").split(","):
+            if "=" in item:
+                host, per_minute = item.split("=", 1)
+                limits[host.strip().lower()] = float(per_minute)
+        path = os.getenv("BIBBLE_HOST_STATE")
+        return cls(
+            limits,
+            failure_threshold=int(os.getenv("BIBBLE_HOST_FAILURES", 5)),
+            cooldown=float(os.getenv("BIBBLE_HOST_COOLDOWN", 60)),
+            store=SQLiteHostStore(path) if path else None,
+        )
+
+    def _per_minute(self, host: str):
+        host = host.lower()
+        while host:
+            if host in self.limits:
+                return self.limits[host]
+            host = host.partition(".")[2]   # www.hoodmaps.com -> hoodmaps.com
+        return self.default_per_minute
+
+    def _update(self, host: str, fn):
+        per_minute = self._per_minute(host)
+        if per_minute is None:
+            per_minute = 0.0   # only the circuit breaker applies
+        return self.store.update(host.lower(), _initial_state(per_minute),
+                                 lambda state: fn(state, per_minute / 60.0))
+
+    # ------------------------------------------------------------------
+    def reserve(self, host: str):
+        """
+        Takes a token for one request to `host` if possible. Returns 0 (go
+        ahead), the seconds to wait before trying again, or None while the
+        host's circuit is open.
+        """
+        def take(state, max_rate):
+            now = time.time()
+            if state["failures"] >= self.failure_threshold:
+                if now < state["open_until"]:
+                    return None
+                # Half-open: this request is the probe, everyone else waits
+                state["open_until"] = now + self.cooldown
+                return 0.0
+            if now < state["paused_until"]:
+                return state["paused_until"] - now
+            if not max_rate:
+                return 0.0
+            burst = max(max_rate * 10.0, 1.0)
+            state["tokens"] = min(burst, state["tokens"] + (now - state["updated"]) * state["rate"])
+            state["updated"] = now
+            if state["tokens"] >= 1.0:
+                state["tokens"] -= 1.0
+                return 0.0
+            return (1.0 - state["tokens"]) / state["rate"]
+        return self._update(host, take)
+
+    def acquire(self, host: str, max_wait: float = 10.0) -> bool:
+        """
+        Blocks until a request to `host` may be sent. False if the circuit
+        is open or the wait would exceed `max_wait` seconds.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.reserve(host)
+            if wait is None:
+                return False
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def record(self, host: str, status: int = None, error: bool = False, retry_after: float = None):
+        """
+        Reports the outcome of a request: its HTTP `status`, or `error` for
+        a connection failure / timeout or an unusable answer (e.g. an empty
+        news feed, see city_processor.lost_items). Throttling statuses slow
+        the host down; any failure counts towards tripping the circuit.
+        """
+        throttled = status in THROTTLE_STATUSES
+        failed = throttled or error or (status is not None and status >= 500)
+
+        def apply(state, max_rate):
+            now = time.time()
+            if not failed:
+                state["failures"] = 0
+                state["open_until"] = 0.0
+                state["rate"] = min(max_rate, state["rate"] + max_rate / 10.0)
+                return
+            state["failures"] += 1
+            if throttled:
+                state["rate"] = max(max_rate * MIN_RATE_FACTOR, state["rate"] / 2.0)
+                pause = retry_after if retry_after is not None else \
+                    min(MAX_BACKOFF, BACKOFF * 2 ** (state["failures"] - 1))
+                state["paused_until"] = max(state["paused_until"], now + pause)
+            if state["failures"] >= self.failure_threshold:
+                state["open_until"] = now + self.cooldown
+                if state["failures"] == self.failure_threshold:
+                    print(f"⚠️ {host} failed {state['failures']} times in a row, "
+                          f"pausing it for {self.cooldown:.0f}s")
+        self._update(host, apply)
+
+    def state(self, host: str) -> dict:
+        """A copy of the host's current state (for /cache/stats and tests)."""
+        return self._update(host, lambda state, max_rate: dict(state))
+
+
+def retry_after_seconds(headers):
+    """The Retry-After header in seconds (None if missing or a date)."""
+    value = (headers or {}).get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,47 @@
+# http_client.py
+#
+# Shared, pooled HTTP clients. Every upstream call (HoodMaps, Google News,
+# the external API) goes through one keep-alive connection pool per worker
+# instead of opening a new TCP/TLS connection per request.
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 32          # connections kept alive per host
+POOL_HOSTS = 8          # distinct hosts with their own pool
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """The process-wide pooled `requests` session (created on first use)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def new_async_client(timeout: float = 30.0, headers: dict = None):
+    """
+    A pooled `httpx.AsyncClient` for the async pipeline. Async clients are
+    bound to an event loop, so the ASGI app creates one at startup and
+    closes it at shutdown.
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        timeout=timeout,
+        headers=headers,
+        limits=httpx.Limits(max_connections=POOL_SIZE * POOL_HOSTS,
+                            max_keepalive_connections=POOL_SIZE),
+        follow_redirects=True,
+    )
@@ -0,0 +1,86 @@
+# llm_batching.py
+#
+# Splits the per-neighbourhood records of a safety prompt into chunks that
+# fit a token budget, runs the chunks concurrently and merges the answers
+# back in the original order. Only chunks that fail are retried.
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+
+# Prompt tokens of records per chunk (the system prompt comes on top)
+CHUNK_TOKEN_BUDGET = 1500
+# Records per chunk, so the answer (~150 tokens per neighbourhood) fits max_tokens
+CHUNK_MAX_RECORDS = 6
+# Chunks in flight at once
+MAX_PARALLEL = 4
+# Extra attempts for a failed chunk, with exponential backoff
+MAX_RETRIES = 2
+RETRY_BACKOFF = 1.0  # seconds, doubled per attempt
+
+
+def estimate_tokens(obj) -> int:
+    """Rough token count of a JSON-serialisable object (~4 characters per token)."""
+    return len(json.dumps(obj, ensure_ascii=False, indent=2)) // 4 + 1
+
+
+def split_records(records, token_budget: int = CHUNK_TOKEN_BUDGET,
+                  max_records: int = CHUNK_MAX_RECORDS):
+    """
+    Greedily packs `records` (in order) into chunks of at most
+    `token_budget` estimated tokens and `max_records` records. A record that
+    is larger than the budget on its own gets a chunk to itself.
+    """
+    chunks, current, used = [], [], 0
+    for record in records:
+        cost = estimate_tokens(record)
+        if current and (used + cost > token_budget or len(current) >= max_records):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(record)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def run_chunks(chunks, call, max_parallel: int = MAX_PARALLEL,
+               max_retries: int = MAX_RETRIES, backoff: float = RETRY_BACKOFF) -> list:
+    """
+    Runs ``call(chunk) -> list`` for every chunk on a thread pool of
+    `max_parallel` workers and concatenates the results in chunk order.
+
+    Failed chunks are retried (alone) up to `max_retries` times; if any
+    chunk still fails a RuntimeError is raised.
+    """
+    results = [None] * len(chunks)
+    pending = list(range(len(chunks)))
+    last_error = None
+
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+            print(f"🔁 Retrying {len(pending)} LLM chunk(s), attempt {attempt + 1}")
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(pending)))) as pool:
+            futures = {metrics.submit(pool, call, chunks[i]): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"⚠️ LLM chunk {i + 1}/{len(chunks)} failed: {e}")
+                    last_error = e
+                    failed.append(i)
+        pending = sorted(failed)
+        if not pending:
+            break
+
+    if pending:
+        raise RuntimeError(
+            f"{len(pending)} of {len(chunks)} LLM chunks failed after "
+            f"{max_retries + 1} attempts: {last_error}"
+        )
+    return [item for chunk_result in results for item in chunk_result]
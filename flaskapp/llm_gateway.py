@@ -0,0 +1,94 @@
+# llm_gateway.py
+#
+# Long-lived access point to the OpenAI-compatible chat endpoint, created
+# once per worker (something.llm_gateway()) instead of once per call:
+#
+#   - one OpenAI client on a pooled keep-alive httpx connection pool
+#   - request timeout and retries with exponential backoff (connection
+#     errors, 408/409/429 and 5xx; done by the OpenAI SDK)
+#   - a semaphore bounding the completions in flight from this worker
+#   - the system message is built once, so every request starts with the
+#     same byte-identical prefix that providers can cache; with
+#     `prompt_cache` a ``prompt_cache_key`` derived from it is sent as well
+#
+# Point `base_url` at a local OpenAI-compatible stub (see
+# experimentation/stub_servers.py) for offline benchmarking.
+
+import hashlib
+import threading
+
+import httpx
+from openai import OpenAI
+
+from http_client import POOL_SIZE
+
+
+class LLMGateway:
+    """
+    Chat completions for one model and one fixed system prompt.
+
+        gateway = LLMGateway(base_url, api_key, system_prompt, model)
+        gateway.complete(user_content, max_tokens=1000, temperature=0.4)
+    """
+
+    def __init__(self, base_url: str, api_key: str, system_prompt: str, model: str,
+                 timeout: float = 60.0, max_retries: int = 2,
+                 max_concurrency: int = 8, prompt_cache: bool = False):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.base_url = base_url
+        self.model = model
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.prompt_digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        self.prompt_cache = prompt_cache
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.client = OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=max_retries,
+            http_client=httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=max(POOL_SIZE, max_concurrency),
+                                    max_keepalive_connections=max_concurrency),
+            ),
+        )
+
+    def messages(self, user_content: str) -> list:
+        return [self.system_message, {"role": "user", "content": user_content}]
+
+    def _params(self, user_content: str, params: dict) -> dict:
+        params = {"model": self.model, "messages": self.messages(user_content), **params}
+        if self.prompt_cache:
+            params.setdefault("prompt_cache_key", self.prompt_digest[:32])
+        return params
+
+    def complete(self, user_content: str, **params):
+        """One chat completion (the SDK response object); waits for a free slot."""
+        with self._slots:
+            return self.client.chat.completions.create(**self._params(user_content, params))
+
+    def stream(self, user_content: str, on_usage=None, **params):
+        """
+        Yields the text deltas of a streamed completion. The slot is held
+        until the stream is exhausted or closed. With `on_usage`, the token
+        usage is requested too and passed to ``on_usage(usage)`` at the end.
+        """
+        if on_usage is not None:
+            params.setdefault("stream_options", {"include_usage": True})
+        with self._slots:
+            stream = self.client.chat.completions.create(
+                stream=True, **self._params(user_content, params)
+            )
+            with stream:
+                for chunk in stream:
+                    if chunk.usage is not None and on_usage is not None:
+                        on_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+
+    def close(self):
+        self.client.close()
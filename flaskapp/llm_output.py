@@ -0,0 +1,205 @@
+# llm_output.py
+#
+# Parsing and validation of the model's safety assessments.
+#
+# JsonArrayExtractor pulls the objects of the first JSON array out of the
+# model's text in a single pass, and can be fed a streamed answer chunk by
+# chunk. Each object is then checked against the OUTPUT JSON SCHEMA of the
+# system prompt and turned into a SafetyAssessment.
+
+import json
+import re
+from dataclasses import dataclass, field
+
+
+class JsonArrayExtractor:
+    """
+    Incremental extractor for the objects of the first top-level JSON array
+    of objects in a text (anything around it, such as code fences or a
+    preamble like "Here is the result [as requested]:", is ignored).
+
+        extractor = JsonArrayExtractor()
+        for delta in stream:
+            for obj in extractor.feed(delta):
+                ...
+
+    Every character is scanned once; an object is parsed with json.loads as
+    soon as its closing brace arrives. A "[" only opens the array if the
+    next non-blank character is "{" or "]", and text between the objects
+    other than commas means it was not the JSON array after all: the
+    extractor then starts looking again (objects already returned by an
+    earlier feed() stay returned).
+    """
+
+    def __init__(self):
+        self._buffer = []       # text of the object being read
+        self._opening = False   # seen a "[", waiting for "{" or "]"
+        self._started = False   # inside the array
+        self.done = False       # seen the closing "]"
+        self._depth = 0         # nesting inside the array
+        self._in_string = False
+        self._escape = False
+        self.errors = []        # objects that were not valid JSON
+
+    def feed(self, text: str) -> list:
+        """Consumes `text` and returns the objects completed by it."""
+        completed = []
+        array_start = 0         # index in `completed` of this array's first object
+        for ch in text:
+            if self.done:
+                break
+            if not self._started:
+                if self._opening and ch.isspace():
+                    continue
+                if self._opening and ch in "{]":
+                    self._started = True
+                    array_start = len(completed)
+                    if ch == "]":
+                        self.done = True
+                        continue
+                else:
+                    self._opening = ch == "["
+                    continue
+
+            if self._depth > 0:
+                self._buffer.append(ch)
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_string = False
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        raw = "".join(self._buffer)
+                        self._buffer = []
+                        try:
+                            completed.append(json.loads(raw))
+                        except ValueError as e:
+                            self.errors.append(f"{e}: {raw[:200]}")
+            elif ch == "{":
+                self._depth = 1
+                self._buffer = [ch]
+            elif ch == "]":
+                self.done = True
+            elif not (ch.isspace() or ch == ","):
+                # Not an array of objects: drop it and look for the next "["
+                del completed[array_start:]
+                self._started = False
+                self._opening = ch == "["
+        return completed
+
+    @property
+    def found_array(self) -> bool:
+        return self._started
+
+
+# ----------------------------------------------------------------------
+# Output schema
+# ----------------------------------------------------------------------
+SCHEMA_KEYS = (
+    "Neighbourhood",
+    "Safety Score",
+    "Top 3 Safe Places",
+    "Safety Overview",
+    "Social Character",
+)
+
+_SCORE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:/\s*5(?:\.0+)?)?\s*$")
+
+
+@dataclass
+class SafetyAssessment:
+    neighbourhood: str
+    safety_score: float                       # 0.0 - 5.0
+    top_safe_places: list = field(default_factory=list)
+    safety_overview: str = ""
+    social_character: str = ""
+
+    def to_dict(self) -> dict:
+        """The assessment in the prompt's output schema."""
+        return {
+            "Neighbourhood": self.neighbourhood,
+            "Safety Score": f"{self.safety_score:.1f}/5.0",
+            "Top 3 Safe Places": list(self.top_safe_places),
+            "Safety Overview": self.safety_overview,
+            "Social Character": self.social_character,
+        }
+
+
+def validate_assessment(obj) -> SafetyAssessment:
+    """Checks one model object against the output schema; raises ValueError."""
+    if not isinstance(obj, dict):
+        raise ValueError(f"expected an object, got {type(obj).__name__}")
+    missing = [k for k in SCHEMA_KEYS if k not in obj]
+    if missing:
+        raise ValueError(f"missing keys {missing}")
+
+    name = obj["Neighbourhood"]
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("Neighbourhood must be a non-empty string")
+
+    score = obj["Safety Score"]
+    if isinstance(score, (int, float)) and not isinstance(score, bool):
+        value = float(score)
+    else:
+        match = _SCORE.match(str(score))
+        if not match:
+            raise ValueError(f"Safety Score {score!r} is not of the form X.Y/5.0")
+        value = float(match.group(1))
+    if not 0.0 <= value <= 5.0:
+        raise ValueError(f"Safety Score {value} is outside 0.0-5.0")
+
+    places = obj["Top 3 Safe Places"]
+    if not isinstance(places, list) or not all(isinstance(p, str) for p in places):
+        raise ValueError("Top 3 Safe Places must be a list of strings")
+    if len(places) > 3:
+        raise ValueError("Top 3 Safe Places has more than three entries")
+
+    for key in ("Safety Overview", "Social Character"):
+        if not isinstance(obj[key], str) or not obj[key].strip():
+            raise ValueError(f"{key} must be a non-empty string")
+
+    return SafetyAssessment(
+        neighbourhood=name.strip(),
+        safety_score=value,
+        top_safe_places=places,
+        safety_overview=obj["Safety Overview"].strip(),
+        social_character=obj["Social Character"].strip(),
+    )
+
+
+def parse_assessments(text: str, neighbourhoods) -> dict:
+    """
+    Extracts and validates every assessment in a model answer.
+
+    Returns ``{neighbourhood: SafetyAssessment}`` for the requested
+    `neighbourhoods` that came back valid; the others are simply absent.
+    Raises ValueError if the answer contains no JSON array at all.
+    """
+    extractor = JsonArrayExtractor()
+    objects = extractor.feed(text or "")
+    if not extractor.found_array:
+        raise ValueError(f"No JSON array found in model output:\n{text}")
+    for error in extractor.errors:
+        print(f"⚠️ Skipping malformed object in model output: {error}")
+
+    wanted = {n.casefold(): n for n in neighbourhoods}
+    valid = {}
+    for obj in objects:
+        try:
+            assessment = validate_assessment(obj)
+        except ValueError as e:
+            print(f"⚠️ Invalid assessment {str(obj)[:80]}: {e}")
+            continue
+        name = wanted.get(assessment.neighbourhood.casefold())
+        if name is not None and name not in valid:
+            assessment.neighbourhood = name
+            valid[name] = assessment
+    return valid
@@ -1,20 +1,75 @@
 # main.py
 
-import requests
-from flask import Flask, jsonify, request
-from city_processor import process_city_data
-from userInput import generate_synthetic_tourist_data
-from something import generate_neighbourhood_safety_json
+import atexit
+import json
+import os
+import time
+
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+import city_processor
+from city_processor import iter_city_data
+from delivery import DeliveryQueue
+from http_client import session
+from llm_output import JsonArrayExtractor, validate_assessment
+import something
+from something import generate_neighbourhood_safety_json, stream_neighbourhood_safety_json
+from pipeline import (BULK_MAX_CITIES, EMOJI_STORE, assess_city_coalesced, assess_city_warmup,
+                      iter_assess_cities, normalize_city)
+from warmup import WarmupScheduler
+import metrics
+from metrics import stage
+from scoring import local_assessments
 
 app = Flask(__name__)
 
 # External API URL where we'll send the processed data
 EXTERNAL_API_URL = "https://httpbin.org/post"   # echoes your JSON back
+EXTERNAL_API_TIMEOUT = 10.0
 
+# Precomputed results for the cities in BIBBLE_HOT_CITIES
+WARMUP = WarmupScheduler.from_env(assess_city_warmup)
+if WARMUP.cities:
+    WARMUP.start()
+
+
+# Send "X-Bibble-Trace: 1" to get the per-stage breakdown of a request
+# back in a Server-Timing header (as a final "timing" event for the
+# streaming endpoints, whose headers go out before any work is done)
+TRACE_HEADER = "X-Bibble-Trace"
+
+
+@app.before_request
+def _start_request_metrics():
+    g.started = time.perf_counter()
+    if request.headers.get(TRACE_HEADER):
+        g.trace_token = metrics.start_trace()
 
-import json
-from pathlib import Path
-from typing import List, Any, Optional
+
+@app.after_request
+def _add_trace_header(response):
+    g.status = response.status_code
+    token = g.pop("trace_token", None)
+    if token is not None:
+        stages = metrics.end_trace(token)
+        if stages:
+            response.headers["Server-Timing"] = metrics.server_timing(stages)
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    if request.endpoint not in (None, "metrics_endpoint"):
+        failed = exc is not None or g.get("status", 500) >= 500
+        metrics.observe(f"request_{request.endpoint}", time.perf_counter() - g.started, failed)
+    token = g.pop("trace_token", None)
+    if token is not None:  # request failed before after_request ran
+        metrics.end_trace(token)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus scrape endpoint
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route('/process_city', methods=['POST'])
@@ -27,43 +82,303 @@ def process_city():
         return jsonify({"error": "City parameter is required!"}), 400
 
     # Step 1: Process the city data using the Langchain agent
+    # (answered from the warm-up store for hot cities; a stale result is
+    # served while a refresh runs in the background). Concurrent requests
+    # for the same city share a single pipeline run. With "fast": true the
+    # assessment comes from the local scoring engine, without the LLM.
+    city = normalize_city(city)
+    fast = _fast_mode()
+    result, stale = WARMUP.get(city)
+    if result is None:
+        result = assess_city_coalesced(city, fast=fast)
+        if result is None:
+            return jsonify({"error": f"No neighbourhood data found for {city}"}), 404
+    elif stale:
+        print(f"Serving stale warm-up result for {city}")
+
+    processed_data = result["neighbourhoods"]
+    final_json = result["assessment"]
+
+    print(f"Processed data: {final_json}")
+
+
+    # Step 2: Send the processed data to an external API via POST request
+    # (queued; see deliver_to_external_api)
+    return jsonify({
+        "status": "success",
+        "assessment": final_json,
+        "external_response": deliver_to_external_api(processed_data),
+    }), 200
+
+
+def _fast_mode() -> bool:
+    # "fast": true in the JSON body, or ?fast=1
+    body = request.get_json(silent=True) or {}
+    return bool(body.get("fast")) or request.args.get("fast", "").lower() in ("1", "true", "yes")
+
+
+def _sse(event, data):
+    # One server-sent event
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _traced_stream(events, traced: bool):
+    # The events of a streaming response, traced while they are generated
+    # (after_request has already ended the request's own trace); the stages
+    # follow as a "timing" event with the Server-Timing value
+    if not traced:
+        yield from events
+        return
+    token = metrics.start_trace()
+    try:
+        yield from events
+    finally:
+        stages = metrics.end_trace(token)
+    if stages:
+        yield _sse("timing", {"server_timing": metrics.server_timing(stages)})
+
+
+@app.route('/process_city/stream', methods=['POST'])
+def process_city_stream():
+    # Streaming variant of /process_city (server-sent events):
+    #   start          sent at once, before anything is fetched
+    #   neighbourhood  one per neighbourhood, as soon as its news is fetched
+    #   score          local Safety Score + Top 3 Safe Places per neighbourhood,
+    #                  before the LLM is called (scoring.py)
+    #   assessment     LLM output deltas, as they are generated (not in fast mode)
+    #   safety         one validated assessment per neighbourhood, parsed
+    #                  from the deltas as soon as its object is complete
+    #   external       response of the external API
+    #   done / error
+    #   timing         with X-Bibble-Trace: the per-stage breakdown, last
+    city = (request.json or {}).get('city')
+    print(f"Received city (stream): {city}")
+
+    if not city:
+        return jsonify({"error": "City parameter is required!"}), 400
     city = city.lower()
-    processed_data = process_city_data(city)
+    fast = _fast_mode()
+
+    def generate():
+        # First bytes go out before the HoodMaps scrape, however slow it is
+        yield _sse("start", {"city": city, "fast": fast})
+        try:
+            found = {}
+            for index, info in iter_city_data(city):
+                found[index] = info
+                yield _sse("neighbourhood", {"index": index, **info})
+            processed_data = [found[i] for i in sorted(found)]
+            if not processed_data:
+                yield _sse("error", {"error": f"No neighbourhood data found for {city}"})
+                return
 
-    json_str = json.dumps(processed_data, indent=4)
-    df = generate_synthetic_tourist_data()
-    df_str = df.to_string(index=False)
+            emoji_table = EMOJI_STORE.city_slice(city)
+            emoji_ratio = EMOJI_STORE.emoji4_ratios(city)
+            with stage("emoji_stats"):
+                records = something.build_safety_records(processed_data, emoji_table, emoji_ratio)
+            local = {a.neighbourhood: a for a in local_assessments(records)}
+            for a in local.values():
+                item = a.to_dict()
+                yield _sse("score", {k: item[k] for k in ("Neighbourhood", "Safety Score", "Top 3 Safe Places")})
+            # Unchanged neighbourhoods are answered from their stored
+            # assessment; only the others are streamed from the model. In fast
+            # mode nothing is streamed; every neighbourhood is "missing" below
+            # and answered by the local engine
+            assessed = set()
+            changed = processed_data
+            if not fast:
+                changed = []
+                for info, stored in zip(processed_data, something._reuse_assessments(records)):
+                    name = info["neighbourhood"]
+                    if stored is None:
+                        changed.append(info)
+                        continue
+                    assessed.add(name)
+                    if something.LOCAL_SCORES:
+                        stored.safety_score = local[name].safety_score
+                        stored.top_safe_places = local[name].top_safe_places
+                    yield _sse("safety", stored.to_dict())
+            deltas = () if fast or not changed else stream_neighbourhood_safety_json(
+                changed, emoji_table, emoji_ratio=emoji_ratio,
+            )
+            by_name = {r["neighbourhood"]: r for r in records}
+            wanted = {d["neighbourhood"].casefold(): d["neighbourhood"] for d in changed}
+            extractor = JsonArrayExtractor()
+            llm_failed = False
+            try:
+                for delta in deltas:
+                    yield _sse("assessment", {"delta": delta})
+                    for obj in extractor.feed(delta):
+                        try:
+                            assessment = validate_assessment(obj)
+                        except ValueError as e:
+                            print(f"⚠️ Invalid streamed assessment: {e}")
+                            continue
+                        name = wanted.get(assessment.neighbourhood.casefold())
+                        if name and name not in assessed:
+                            assessed.add(name)
+                            assessment.neighbourhood = name
+                            something._store_assessments([by_name[name]], [assessment])
+                            if something.LOCAL_SCORES:
+                                assessment.safety_score = local[name].safety_score
+                                assessment.top_safe_places = local[name].top_safe_places
+                            yield _sse("safety", assessment.to_dict())
+            except Exception as e:
+                # As in the synchronous path: the model is down, so the rest
+                # is answered with local scores instead of being re-asked
+                print(f"⚠️ Streamed LLM assessment failed, answering with local scores: {e}")
+                llm_failed = True
 
-    articles       = []          # List[dict]
-    emoji_table    = df       # pandas DataFrame
-    vibe_keywords  = processed_data        # Dict[str, List[str]]
+            # Re-ask (without streaming) only for what was missing or invalid
+            missing = [d for d in processed_data if d["neighbourhood"] not in assessed]
+            if missing:
+                for item in generate_neighbourhood_safety_json(missing, emoji_table, emoji_ratio=emoji_ratio,
+                                                               fast=fast or llm_failed):
+                    yield _sse("safety", item)
 
-    final_json = generate_neighbourhood_safety_json(
-          vibe_keywords, emoji_table
+            yield _sse("external", deliver_to_external_api(processed_data))
+            yield _sse("done", {"status": "success"})
+        except Exception as e:
+            print(f"❌ Streaming /process_city failed: {e}")
+            yield _sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(_traced_stream(generate(), bool(request.headers.get(TRACE_HEADER)))),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    print(f"Processed data: {final_json}")
 
+@app.route('/process_cities', methods=['POST'])
+def process_cities():
+    # Bulk variant of /process_city for up to BULK_MAX_CITIES cities, as
+    # server-sent events:
+    #   city   one per city, in the order they finish: the /process_city
+    #          response plus "city", or {"city", "error"}
+    #   done / error
+    #   timing  with X-Bibble-Trace: the per-stage breakdown, last
+    # All cities run at once (pipeline.iter_assess_cities), so the whole
+    # batch takes about as long as the slowest city.
+    body = request.get_json(silent=True) or {}
+    cities = body.get('cities')
+    print(f"Received cities: {cities}")
 
-    # Step 2: Send the processed data to an external API via POST request
-    external_response = send_to_external_api(processed_data)
+    if not isinstance(cities, list) or not all(isinstance(c, str) for c in cities):
+        return jsonify({"error": "Expected a JSON list of cities!"}), 400
+    cities = list(dict.fromkeys(normalize_city(c) for c in cities if c.strip()))
+    if not cities:
+        return jsonify({"error": "Cities parameter is required!"}), 400
+    if len(cities) > BULK_MAX_CITIES:
+        return jsonify({"error": f"At most {BULK_MAX_CITIES} cities per request!"}), 400
+    fast = _fast_mode()
+
+    def city_event(city, result):
+        if result is None:
+            return {"city": city, "error": f"No neighbourhood data found for {city}"}
+        return {
+            "city": city,
+            "status": "success",
+            "assessment": result["assessment"],
+            "external_response": deliver_to_external_api(result["neighbourhoods"]),
+        }
+
+    def generate():
+        try:
+            # Warm-up results first, then the others as they finish
+            pending = []
+            for city in cities:
+                result, stale = WARMUP.get(city)
+                if result is None:
+                    pending.append(city)
+                    continue
+                if stale:
+                    print(f"Serving stale warm-up result for {city}")
+                yield _sse("city", city_event(city, result))
+            for city, result, error in iter_assess_cities(pending, fast=fast):
+                if error is not None:
+                    print(f"❌ Processing {city} failed: {error}")
+                    yield _sse("city", {"city": city, "error": str(error)})
+                else:
+                    yield _sse("city", city_event(city, result))
+            yield _sse("done", {"status": "success", "cities": len(cities)})
+        except Exception as e:
+            print(f"❌ Streaming /process_cities failed: {e}")
+            yield _sse("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(_traced_stream(generate(), bool(request.headers.get(TRACE_HEADER)))),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route('/reactions', methods=['POST'])
+def add_reactions():
+    # Adds new emoji reactions: [{"city", "neighbourhood", "place", "emoji_N": count}, ...]
+    rows = request.json
+    if not isinstance(rows, list):
+        return jsonify({"error": "Expected a JSON list of reactions!"}), 400
+    try:
+        written = EMOJI_STORE.upsert(rows, accumulate=True)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid reaction: {e}"}), 400
+    return jsonify({"status": "success", "rows": written}), 200
 
-    return jsonify({"status": "success", "external_response": external_response.json()}), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    # Hit / miss / eviction counters of the HoodMaps + news and LLM caches
+    stats = {"http": {"enabled": False}, "llm": {"enabled": False}}
+    if city_processor.HTTP_CACHE is not None:
+        stats["http"] = {"enabled": True, **city_processor.HTTP_CACHE.stats()}
+    if something.RESPONSE_CACHE is not None:
+        stats["llm"] = {
+            "enabled": True,
+            "entries": len(something.RESPONSE_CACHE),
+            **something.RESPONSE_CACHE.stats.as_dict(),
+        }
+    if DELIVERY is not None:
+        stats["external_delivery"] = DELIVERY.stats()
+    return jsonify(stats), 200
 
 
 # Function to send data to an external source via a POST request
 def send_to_external_api(data):
-    payload = {"city_info": data}
+    return _post_external({"city_info": data})
+
+
+def _post_external(body):
     headers = {"Content-Type": "application/json"}
-    
+
     # Make the POST request to the external API
-    response = requests.post(EXTERNAL_API_URL, json=payload, headers=headers)
-    
+    with stage("external_api"):
+        response = session().post(EXTERNAL_API_URL, json=body, headers=headers,
+                                  timeout=EXTERNAL_API_TIMEOUT)
+
     if response.status_code != 200:
         raise Exception(f"Failed to send data to external API: {response.status_code}")
-    
+
     return response
 
 
+# Payloads for the external API are delivered in the background, batched
+# and retried (delivery.py), so a slow or failing external API never delays
+# or fails the user's request. BIBBLE_EXTERNAL_QUEUE=0 sends them inline.
+DELIVERY = None
+if os.getenv("BIBBLE_EXTERNAL_QUEUE", "1") != "0":
+    DELIVERY = DeliveryQueue.from_env(_post_external).start()
+    atexit.register(DELIVERY.stop)
+
+
+def deliver_to_external_api(data) -> dict:
+    """
+    Queues `data` for the external API and returns ``{"queued": True}``, or
+    sends it inline (DELIVERY disabled) and returns the API's JSON answer.
+    """
+    if DELIVERY is None:
+        return send_to_external_api(data).json()
+    return {"queued": DELIVERY.submit({"city_info": data})}
+
+
 if __name__ == '__main__':
     app.run(debug=True)
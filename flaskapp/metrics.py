@@ -0,0 +1,168 @@
+# metrics.py
+#
+# Per-stage timing for the pipeline, exported in the Prometheus text format
+# on /metrics:
+#
+#   bibble_stage_duration_seconds{stage}   histogram
+#   bibble_stage_errors_total{stage}       counter
+#   bibble_llm_tokens_total{kind}          counter (prompt / completion)
+#   bibble_queue_depth{queue}              gauge (see delivery.py)
+#
+# Wrap a stage in `with stage("news_fetch"):`. When a request trace is
+# active (see start_trace), the stage is also added to the trace so it can
+# be returned to the caller in a Server-Timing header.
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds (upper bounds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms = {}   # stage -> [bucket counts..., +Inf count, sum]
+_errors = {}       # stage -> count
+_tokens = {}       # kind -> count
+_queues = {}       # queue -> depth
+
+_trace = contextvars.ContextVar("bibble_trace", default=None)
+
+
+class _Trace:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}   # stage -> [total seconds, count, errors]
+
+    def add(self, name, seconds, failed):
+        with self.lock:
+            entry = self.stages.setdefault(name, [0.0, 0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+            entry[2] += int(failed)
+
+
+def observe(name: str, seconds: float, failed: bool = False):
+    """Records one run of stage `name` that took `seconds`."""
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[len(BUCKETS)] += 1
+        hist[-1] += seconds
+        if failed:
+            _errors[name] = _errors.get(name, 0) + 1
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, seconds, failed)
+
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as stage `name`; exceptions count as errors."""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        observe(name, time.perf_counter() - started, failed)
+
+
+def record_llm_usage(usage):
+    """Adds the token usage of a chat completion (may be None) to the counters."""
+    if usage is None:
+        return
+    with _lock:
+        for kind in ("prompt", "completion"):
+            count = getattr(usage, f"{kind}_tokens", None) or 0
+            _tokens[kind] = _tokens.get(kind, 0) + int(count)
+
+
+def set_queue_depth(queue: str, depth: int):
+    """Sets the current number of items waiting in `queue`."""
+    with _lock:
+        _queues[queue] = int(depth)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that carries the current trace into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# ----------------------------------------------------------------------
+# per-request traces
+# ----------------------------------------------------------------------
+def start_trace():
+    """Starts collecting stages for the current request; returns a token."""
+    return _trace.set(_Trace())
+
+
+def end_trace(token) -> dict:
+    """Stops the trace started with `token`: {stage: (seconds, count, errors)}."""
+    trace = _trace.get()
+    _trace.reset(token)
+    if trace is None:
+        return {}
+    with trace.lock:
+        return {name: tuple(values) for name, values in trace.stages.items()}
+
+
+def server_timing(stages: dict) -> str:
+    """Formats a trace as a Server-Timing header value (durations in ms)."""
+    return ", ".join(
+        f'{name};dur={seconds * 1000:.1f};desc="x{count}{f" errors={errors}" if errors else ""}"'
+        for name, (seconds, count, errors) in stages.items()
+    )
+
+
+# ----------------------------------------------------------------------
+# exposition
+# ----------------------------------------------------------------------
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {name: list(values) for name, values in _histograms.items()}
+        errors = dict(_errors)
+        tokens = dict(_tokens)
+        queues = dict(_queues)
+
+    lines = [
+        "# HELP bibble_stage_duration_seconds Duration of pipeline stages.",
+        "# TYPE bibble_stage_duration_seconds histogram",
+    ]
+    for name in sorted(histograms):
+        hist = histograms[name]
+        for i, bound in enumerate(BUCKETS):
+            lines.append(f'bibble_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {hist[i]}')
+        lines.append(f'bibble_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {hist[len(BUCKETS)]}')
+        lines.append(f'bibble_stage_duration_seconds_sum{{stage="{name}"}} {hist[-1]:.6f}')
+        lines.append(f'bibble_stage_duration_seconds_count{{stage="{name}"}} {hist[len(BUCKETS)]}')
+
+    lines += [
+        "# HELP bibble_stage_errors_total Pipeline stage runs that raised an error.",
+        "# TYPE bibble_stage_errors_total counter",
+    ]
+    for name in sorted(histograms):
+        lines.append(f'bibble_stage_errors_total{{stage="{name}"}} {errors.get(name, 0)}')
+
+    lines += [
+        "# HELP bibble_llm_tokens_total Tokens reported by the LLM endpoint.",
+        "# TYPE bibble_llm_tokens_total counter",
+    ]
+    for kind in ("prompt", "completion"):
+        lines.append(f'bibble_llm_tokens_total{{kind="{kind}"}} {tokens.get(kind, 0)}')
+
+    if queues:
+        lines += [
+            "# HELP bibble_queue_depth Items waiting in a background queue.",
+            "# TYPE bibble_queue_depth gauge",
+        ]
+        for name in sorted(queues):
+            lines.append(f'bibble_queue_depth{{queue="{name}"}} {queues[name]}')
+    return "\n".join(lines) + "\n"
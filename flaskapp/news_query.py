@@ -0,0 +1,263 @@
+# news_query.py
+#
+# What to pull out of a neighbourhood's Google News feed:
+#
+#   NewsQuery        keywords, date window and per-neighbourhood quota
+#   HeadlineDeduper  drops near-identical headlines, shared by all the
+#                    neighbourhoods of one city (in HoodMaps order, see
+#                    summarize_feeds)
+#   iter_news        lazy generator of cleaned summaries; the feed is only
+#                    read and cleaned until the quota of in-window items is met
+#
+# Batched mode (NewsQuery.batch) asks for several neighbourhoods per feed,
+# or for the whole city at once, and assign_articles hands every article to
+# the neighbourhoods it mentions through a NeighbourhoodIndex.
+
+import os
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from parsing import iter_rss_items, parse_published, strip_tags
+
+_WORD = re.compile(r"\w+")
+# Google News titles end in " - <Publisher>"
+_PUBLISHER = re.compile(r"\s+[-–—|]\s+[^-–—|]{1,60}$")
+
+BATCH_MODES = ("off", "grouped", "city")
+
+
+def _date(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+@dataclass
+class NewsQuery:
+    keywords: tuple = ("crime",)
+    max_items: int = 15                 # in-window, deduplicated items per neighbourhood
+    start_date: datetime = None         # naive UTC, or "YYYY-MM-DD"
+    end_date: datetime = None
+    max_age_days: float = None          # rolling window, relative to the time of the query
+    dedup: bool = True                  # drop near-identical headlines across neighbourhoods
+    batch: str = "off"                  # "off": one feed per neighbourhood, "grouped": OR-ed
+                                        # groups of `group_size` names, "city": one feed per city
+    group_size: int = 8
+
+    def __post_init__(self):
+        self.keywords = tuple(k for k in self.keywords if k)
+        self.start_date = _date(self.start_date)
+        self.end_date = _date(self.end_date)
+        if self.max_items < 1:
+            raise ValueError("max_items must be at least 1")
+        if self.batch not in BATCH_MODES:
+            raise ValueError(f"batch must be one of {BATCH_MODES}, got {self.batch!r}")
+        if self.group_size < 1:
+            raise ValueError("group_size must be at least 1")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Configured from BIBBLE_NEWS_KEYWORDS (comma-separated),
+        BIBBLE_NEWS_MAX_ITEMS, BIBBLE_NEWS_MAX_AGE_DAYS, BIBBLE_NEWS_DEDUP,
+        BIBBLE_NEWS_BATCH and BIBBLE_NEWS_GROUP_SIZE.
+        """
+        keywords = os.getenv("BIBBLE_NEWS_KEYWORDS", "crime").split(",")
+        max_age = os.getenv("BIBBLE_NEWS_MAX_AGE_DAYS")
+        return cls(
+            keywords=tuple(k.strip() for k in keywords),
+            max_items=int(os.getenv("BIBBLE_NEWS_MAX_ITEMS", 15)),
+            max_age_days=float(max_age) if max_age else None,
+            dedup=os.getenv("BIBBLE_NEWS_DEDUP", "1") != "0",
+            batch=os.getenv("BIBBLE_NEWS_BATCH", "off"),
+            group_size=int(os.getenv("BIBBLE_NEWS_GROUP_SIZE", 8)),
+        )
+
+    def window(self, now: datetime = None):
+        """The ``(start, end)`` bounds in effect right now (either may be None)."""
+        start = self.start_date
+        if self.max_age_days is not None:
+            now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+            rolling = now - timedelta(days=self.max_age_days)
+            start = rolling if start is None else max(start, rolling)
+        return start, self.end_date
+
+
+class HeadlineDeduper:
+    """
+    Thread-safe record of the headlines already used. Two headlines are
+    near-identical when their word sets (publisher suffix and punctuation
+    dropped, case-folded) overlap by at least `threshold` (Jaccard).
+    """
+
+    def __init__(self, threshold: float = 0.85):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._word_sets = []
+        self.dropped = 0
+
+    @staticmethod
+    def _words(headline: str):
+        return _WORD.findall(_PUBLISHER.sub("", headline).casefold())
+
+    def claim(self, headline: str) -> bool:
+        """True if `headline` is new (and records it), False for a near-duplicate."""
+        words = self._words(headline)
+        if not words:
+            return True
+        key = " ".join(words)
+        word_set = set(words)
+        with self._lock:
+            duplicate = key in self._keys or any(
+                len(word_set & seen) >= self.threshold * len(word_set | seen)
+                for seen in self._word_sets
+            )
+            if duplicate:
+                self.dropped += 1
+                return False
+            self._keys.add(key)
+            self._word_sets.append(word_set)
+            return True
+
+
+def _in_window(item: dict, start: datetime, end: datetime) -> bool:
+    try:
+        published = parse_published(item["published"])
+    except (KeyError, ValueError):
+        return False
+    return (start is None or published >= start) and (end is None or published <= end)
+
+
+def iter_news(content, query: NewsQuery, seen: HeadlineDeduper = None):
+    """
+    Yields the cleaned summaries of the in-window, not yet seen items of a
+    raw RSS document, at most ``query.max_items`` of them. Stops reading the
+    feed as soon as the quota is met; dates are only parsed when a window is
+    set, and summaries only cleaned for items that are kept.
+    """
+    start, end = query.window()
+    filter_dates = start is not None or end is not None
+    if seen is None and query.dedup:
+        seen = HeadlineDeduper()
+    kept = 0
+    for item in iter_rss_items(content):
+        if filter_dates and not _in_window(item, start, end):
+            continue
+        if seen is not None:
+            headline = item.get("title") or strip_tags(item.get("summary", ""))
+            if not seen.claim(headline):
+                continue
+        yield strip_tags(item.get("summary", "No summary available"))
+        kept += 1
+        if kept >= query.max_items:
+            return
+
+
+def summarize_feeds(contents, query: NewsQuery, seen: HeadlineDeduper = None) -> list:
+    """
+    One list of cleaned summaries (as iter_news) per raw RSS document in
+    `contents`, None for a feed that failed. Near-identical headlines are
+    dropped in the order given, so a headline in several neighbourhoods'
+    feeds always stays with the first of them, however they were fetched.
+    """
+    if seen is None and query.dedup:
+        seen = HeadlineDeduper()
+    return [[] if content is None else list(iter_news(content, query, seen))
+            for content in contents]
+
+
+# ----------------------------------------------------------------------
+# batched mode
+# ----------------------------------------------------------------------
+def _fold(text: str) -> str:
+    """Case- and accent-insensitive form of `text` ("Café" -> "cafe")."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def name_aliases(name: str) -> set:
+    """
+    Spellings of a HoodMaps neighbourhood name to look for in articles:
+    the name itself, its parts around "/" or "&", the text inside and
+    outside parentheses, hyphens as spaces and without a leading "The".
+    """
+    parts = {name}
+    outside = re.sub(r"\s*\(([^)]*)\)\s*", " ", name).strip()
+    parts.update([outside], re.findall(r"\(([^)]*)\)", name))
+    for part in list(parts):
+        parts.update(re.split(r"\s*[/&]\s*", part))
+    aliases = set()
+    for part in parts:
+        # matched against text with hyphens turned into spaces
+        alias = " ".join(_fold(part).replace("-", " ").split())
+        aliases.add(alias)
+        if alias.startswith("the "):
+            aliases.add(alias[4:])
+    return {a for a in aliases if len(a) >= 3}
+
+
+class NeighbourhoodIndex:
+    """Finds which of a city's neighbourhoods a piece of text mentions."""
+
+    def __init__(self, names):
+        self._by_alias = {}
+        for i, name in enumerate(names):
+            for alias in name_aliases(name):
+                self._by_alias.setdefault(alias, set()).add(i)
+        # Longest aliases first, so "de pijp" wins over a shorter overlapping alias
+        alternation = "|".join(re.escape(a) for a in sorted(self._by_alias, key=len, reverse=True))
+        self._pattern = re.compile(rf"(?<!\w)(?:{alternation})(?!\w)") if alternation else None
+
+    def match(self, text: str) -> list:
+        """Indices (into `names`) of the neighbourhoods mentioned in `text`, sorted."""
+        if self._pattern is None:
+            return []
+        found = set()
+        for m in self._pattern.finditer(_fold(text).replace("-", " ")):
+            found |= self._by_alias[m.group(0)]
+        return sorted(found)
+
+
+def assign_articles(contents, names, query: NewsQuery, seen: HeadlineDeduper = None) -> list:
+    """
+    Spreads the articles of the batched feeds in `contents` (raw RSS
+    documents, None for a feed that failed) over the neighbourhoods they
+    mention. Returns one list of cleaned summaries per name, in order, each
+    with at most ``query.max_items`` in-window items.
+
+    Near-identical headlines are dropped once across all feeds; an article
+    that mentions several neighbourhoods is kept for each of them.
+    """
+    index = NeighbourhoodIndex(names)
+    news = [[] for _ in names]
+    open_slots = len(names)
+    start, end = query.window()
+    filter_dates = start is not None or end is not None
+    if seen is None and query.dedup:
+        seen = HeadlineDeduper()
+
+    for content in contents:
+        if content is None:
+            continue
+        for item in iter_rss_items(content):
+            if filter_dates and not _in_window(item, start, end):
+                continue
+            summary = strip_tags(item.get("summary", ""))
+            headline = item.get("title") or summary
+            targets = [i for i in index.match(f"{headline} {summary}")
+                       if len(news[i]) < query.max_items]
+            if not targets:
+                continue
+            if seen is not None and not seen.claim(headline):
+                continue
+            for i in targets:
+                news[i].append(summary or "No summary available")
+                if len(news[i]) == query.max_items:
+                    open_slots -= 1
+            if not open_slots:
+                return news
+    return news
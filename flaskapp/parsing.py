@@ -0,0 +1,93 @@
+# parsing.py
+#
+# Lightweight parsing helpers for the scraping path:
+#   - strip_tags: tag stripper + entity decoder for RSS summaries, in place
+#     of building a BeautifulSoup tree per summary
+#   - find_hoodmaps_payload: bounded scan for the HoodMaps `<em>` block
+#     that stops as soon as the block is closed
+#   - iter_rss_items: streaming RSS 2.0 reader (feedparser only as a fallback
+#     for documents the XML parser rejects)
+#   - parse_published: RSS date parsing, only called when a date filter is set
+
+import io
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from html import unescape
+
+import feedparser
+
+# Tags and comments; a "<" not followed by a tag name is left alone
+_TAG = re.compile(r"<(?:/?[A-Za-z][^>]*|!--.*?--)>", re.DOTALL)
+_EM_OPEN = re.compile(r"<em[^>]*>", re.IGNORECASE)
+_EM_CLOSE = re.compile(r"</em>", re.IGNORECASE)
+
+
+def strip_tags(text: str) -> str:
+    """Plain text of an HTML fragment (same output as BeautifulSoup.get_text for summaries)."""
+    if "<" not in text and "&" not in text:
+        return text
+    return unescape(_TAG.sub("", text))
+
+
+def find_hoodmaps_payload(html: str, prefix: str):
+    """
+    Returns the text after `prefix` inside the first `<em>` element that
+    starts with it (case-insensitive, surrounding whitespace stripped), or
+    None. Only the part of the page up to the end of that element is read.
+    """
+    prefix_folded = prefix.casefold()
+    pos = 0
+    while True:
+        open_tag = _EM_OPEN.search(html, pos)
+        if open_tag is None:
+            return None
+        start = open_tag.end()
+        # skip whitespace between the tag and the prefix
+        while start < len(html) and html[start].isspace():
+            start += 1
+        if html[start:start + len(prefix)].casefold() == prefix_folded:
+            close_tag = _EM_CLOSE.search(html, start + len(prefix))
+            if close_tag is None:
+                return None
+            payload = html[start + len(prefix):close_tag.start()].strip()
+            return payload or None
+        pos = open_tag.end()
+
+
+def iter_rss_items(content):
+    """
+    Lazily yields the ``<item>`` elements of an RSS document as dicts with
+    "title", "link", "published" and "summary" (missing fields are absent).
+    Parsing stops as soon as the caller stops iterating.
+
+    If the document is not well-formed XML, the remaining items are read
+    with feedparser instead.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    yielded = 0
+    try:
+        for _, elem in ET.iterparse(io.BytesIO(content)):
+            if elem.tag != "item":
+                continue
+            item = {}
+            for child, key in (("title", "title"), ("link", "link"),
+                               ("pubDate", "published"), ("description", "summary")):
+                node = elem.find(child)
+                if node is not None and node.text is not None:
+                    item[key] = node.text.strip()
+            elem.clear()
+            yielded += 1
+            yield item
+        return
+    except ET.ParseError as e:
+        print(f"⚠️ RSS is not well-formed XML ({e}), falling back to feedparser")
+
+    for entry in feedparser.parse(content).entries[yielded:]:
+        yield {key: entry[key] for key in ("title", "link", "published", "summary") if key in entry}
+
+
+def parse_published(value: str):
+    """Parses an RSS pubDate such as "Mon, 02 Sep 2024 10:00:00 GMT"."""
+    return datetime.strptime(value, "%a, %d %b %Y %H:%M:%S %Z")
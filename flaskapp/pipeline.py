@@ -0,0 +1,116 @@
+# pipeline.py
+#
+# The full /process_city pipeline for one city, shared by the Flask routes
+# and the background warm-up worker:
+#   HoodMaps + news  ->  emoji stats  ->  LLM assessment
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import metrics
+from city_processor import process_city_data
+from emoji_store import EmojiStore
+from metrics import stage
+from something import generate_neighbourhood_safety_json
+from singleflight import SingleFlight
+from userInput import generate_synthetic_tourist_data
+
+# Emoji reactions, loaded once per worker (seeded with synthetic data when empty)
+EMOJI_STORE = EmojiStore.from_env()
+if EMOJI_STORE.is_empty():
+    with stage("synthetic_data"):
+        EMOJI_STORE.upsert(generate_synthetic_tourist_data())
+
+
+def assess_city(city_lower: str, fast: bool = False, executor=None, emoji_table=None):
+    """
+    Runs the whole pipeline for a (lower-case) city and returns
+
+        {"city": str, "neighbourhoods": [...], "assessment": [...]}
+
+    or None when HoodMaps has no neighbourhood data for it. With fast=True
+    the assessment comes from the local scoring engine, without the LLM.
+    `executor` (a thread pool for the news feeds) and `emoji_table` (an
+    EmojiTable that includes the city) are shared by iter_assess_cities.
+    """
+    processed_data = process_city_data(city_lower, executor=executor)
+    if processed_data is None:
+        return None
+
+    source = EMOJI_STORE if emoji_table is None else emoji_table
+    final_json = generate_neighbourhood_safety_json(
+        processed_data, source.city_slice(city_lower),
+        emoji_ratio=source.emoji4_ratios(city_lower), fast=fast,
+    )
+    return {"city": city_lower, "neighbourhoods": processed_data, "assessment": final_json}
+
+
+def normalize_city(city: str) -> str:
+    """Key used for a city everywhere: lower-case, single spaces."""
+    return " ".join(city.split()).lower()
+
+
+# Concurrent requests for the same city share one pipeline run
+CITY_FLIGHTS = SingleFlight()
+
+
+def assess_city_coalesced(city: str, fast: bool = False, **kwargs):
+    """``assess_city`` behind CITY_FLIGHTS, keyed by the normalized city (and mode)."""
+    city = normalize_city(city)
+    key = (city, "fast") if fast else city
+    result, shared = CITY_FLIGHTS.do(key, assess_city, city, fast=fast, **kwargs)
+    if shared:
+        print(f"Shared in-flight pipeline for {city}")
+    return result
+
+
+def assess_city_warmup(city: str):
+    """
+    ``assess_city`` for the warm-up worker. It has its own flight key, so a
+    live request never joins a run paced by the warm-up budget (see
+    warmup.throttle); it starts its own instead.
+    """
+    city = normalize_city(city)
+    result, _ = CITY_FLIGHTS.do((city, "warmup"), assess_city, city)
+    return result
+
+
+# ----------------------------------------------------------------------
+# many cities at once (/process_cities)
+# ----------------------------------------------------------------------
+BULK_MAX_CITIES = int(os.getenv("BIBBLE_BULK_MAX_CITIES", 20))
+# News feeds in flight at once, over all cities of one bulk request
+BULK_MAX_WORKERS = int(os.getenv("BIBBLE_BULK_WORKERS", 16))
+
+
+def iter_assess_cities(cities, fast: bool = False, max_workers: int = BULK_MAX_WORKERS):
+    """
+    Runs the pipeline for several cities at once and yields
+    ``(city, result, error)`` as each city finishes (`result` as returned by
+    assess_city, `error` the exception if it failed).
+
+    The news feeds of all cities share one pool of `max_workers` threads,
+    the emoji reactions of all cities are read in one query, and LLM calls
+    are bounded by the LLM gateway, so the whole batch takes about as long
+    as its slowest city.
+    """
+    cities = list(dict.fromkeys(normalize_city(c) for c in cities if c and c.strip()))
+    if not cities:
+        return
+    with stage("emoji_snapshot"):
+        emoji_table = EMOJI_STORE.snapshot(cities=cities)
+
+    news_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-news")
+    city_pool = ThreadPoolExecutor(max_workers=len(cities), thread_name_prefix="bulk-city")
+    try:
+        run = partial(assess_city_coalesced, fast=fast, executor=news_pool, emoji_table=emoji_table)
+        futures = {metrics.submit(city_pool, run, city): city for city in cities}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    finally:
+        city_pool.shutdown(wait=False, cancel_futures=True)
+        news_pool.shutdown(wait=False, cancel_futures=True)
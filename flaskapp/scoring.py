@@ -0,0 +1,164 @@
+# scoring.py
+#
+# Local, deterministic version of the Safety Score the system prompt asks
+# the model for:
+#
+#   score = 5 * (0.5 * emoji + 0.3 * news + 0.2 * hoodmaps)
+#
+#   emoji     Emoji 4 share of all reactions (full marks at EMOJI_RATIO_FULL)
+#   news      headlines on crime / violence lower it, patrols and community
+#             action raise it slightly (0.5 with no news)
+#   hoodmaps  negative / positive vibe keywords (0.5 with none)
+#
+# Each part is in [0, 1]. A neighbourhood without emoji reactions (ratio
+# None) has no emoji part: the other two weights are scaled up to 1. Works on the records of
+# something.build_safety_records and scores all neighbourhoods of a city in
+# one pass of vectorized lexicon matching, so the numeric fields do not
+# need the LLM at all.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from llm_output import SafetyAssessment
+
+EMOJI_WEIGHT = 0.5
+NEWS_WEIGHT = 0.3
+HOODMAPS_WEIGHT = 0.2
+
+# With five emoji kinds an even split gives Emoji 4 a 0.2 share
+EMOJI_RATIO_FULL = 0.4
+# A positive headline counts for this fraction of a negative one ("slightly")
+NEWS_POSITIVE_WEIGHT = 0.5
+# Change of the HoodMaps part per keyword
+HOODMAPS_STEP = 0.25
+
+HOODMAPS_NEGATIVE = frozenset({
+    "crime", "criminal", "ghetto", "unsafe", "dangerous", "sketchy", "shady",
+    "drugs", "dealers", "junkies", "homeless", "robberies", "theft",
+    "pickpockets", "gangs", "violent", "rough", "dodgy", "prostitution",
+})
+HOODMAPS_POSITIVE = frozenset({
+    "techies", "families", "quiet", "expat", "expats", "safe", "rich",
+    "wealthy", "residential", "green", "parks", "calm", "peaceful",
+    "upscale", "posh", "suburban", "elderly", "offices",
+})
+
+NEWS_NEGATIVE = re.compile(
+    r"\b(?:stab\w*|shoot\w*|shot|gun\w*|murder\w*|homicide\w*|kill\w*|robber\w*|"
+    r"robbed|mugg\w*|assault\w*|attack\w*|theft\w*|thie\w*|burglar\w*|"
+    r"violen\w*|rape\w*|carjack\w*|knife|spike in|crime wave|riot\w*)\b"
+)
+NEWS_POSITIVE = re.compile(
+    r"\b(?:patrol\w*|community|neighbou?rhood watch|safety measures?|"
+    r"crime (?:drop|fall|declin)\w*|police presence|cctv|street ?lights?|clean[- ]?up)\b"
+)
+
+_STRIP = ".,;:!?\"'()[]"
+
+
+def _owners(lists) -> np.ndarray:
+    """Record index of every element of the concatenated `lists`."""
+    return np.repeat(np.arange(len(lists)), [len(items) for items in lists])
+
+
+def score_records(records) -> pd.DataFrame:
+    """
+    Scores the records of ``build_safety_records`` (one per neighbourhood).
+
+    Returns a frame indexed by neighbourhood with the parts ``emoji`` (NaN
+    without reactions), ``news`` and ``hoodmaps`` (0-1), the headline counts ``headlines``,
+    ``negative_news`` and ``positive_news``, the keyword counts
+    ``negative_keywords`` and ``positive_keywords``, and ``score`` (0.0-5.0,
+    one decimal).
+    """
+    n = len(records)
+    names = [r["neighbourhood"] for r in records]
+
+    ratio = np.array([np.nan if r.get("emoji4_ratio") is None else float(r["emoji4_ratio"])
+                      for r in records], dtype=float)
+    emoji = np.clip(ratio / EMOJI_RATIO_FULL, 0.0, 1.0)
+    has_emoji = ~np.isnan(emoji)
+
+    # HoodMaps: one row per (neighbourhood, keyword)
+    keywords = [r.get("vibe_keywords") or [] for r in records]
+    words = pd.Series([w for kws in keywords for w in kws], dtype=object)
+    words = words.str.strip(_STRIP).str.casefold()
+    owners = _owners(keywords)
+    neg_kw = np.bincount(owners, weights=words.isin(HOODMAPS_NEGATIVE), minlength=n)
+    pos_kw = np.bincount(owners, weights=words.isin(HOODMAPS_POSITIVE), minlength=n)
+    hoodmaps = np.clip(0.5 + HOODMAPS_STEP * (pos_kw - neg_kw), 0.0, 1.0)
+
+    # News: one row per headline
+    news = [r.get("news") or [] for r in records]
+    headlines = pd.Series([h for items in news for h in items], dtype=object).str.casefold()
+    owners = _owners(news)
+    count = np.bincount(owners, minlength=n)
+    neg_news = np.bincount(owners, weights=headlines.str.contains(NEWS_NEGATIVE), minlength=n)
+    pos_news = np.bincount(owners, weights=headlines.str.contains(NEWS_POSITIVE), minlength=n)
+    net = (NEWS_POSITIVE_WEIGHT * pos_news - neg_news) / np.maximum(count, 1)
+    news_part = np.clip(0.5 + 0.5 * net, 0.0, 1.0)
+
+    # Without reactions the emoji weight is dropped and the rest renormalized
+    emoji_weight = np.where(has_emoji, EMOJI_WEIGHT, 0.0)
+    weighted = (np.where(has_emoji, emoji, 0.0) * emoji_weight
+                + NEWS_WEIGHT * news_part + HOODMAPS_WEIGHT * hoodmaps)
+    score = 5.0 * weighted / (emoji_weight + NEWS_WEIGHT + HOODMAPS_WEIGHT)
+    return pd.DataFrame({
+        "emoji": emoji,
+        "news": news_part,
+        "hoodmaps": hoodmaps,
+        "headlines": count,
+        "negative_news": neg_news.astype(int),
+        "positive_news": pos_news.astype(int),
+        "negative_keywords": neg_kw.astype(int),
+        "positive_keywords": pos_kw.astype(int),
+        "score": np.round(np.clip(score, 0.0, 5.0), 1),
+    }, index=pd.Index(names, name="neighbourhood"))
+
+
+def top_places(record, n: int = 3) -> list:
+    """Names of the `n` places with the most Emoji 4 reactions."""
+    counts = sorted(record.get("top_places_counts") or [], key=lambda p: -p["emoji4"])
+    return [p["place"] for p in counts[:n]]
+
+
+def _overview(row, record) -> str:
+    if not row.headlines:
+        news = "No recent local news was found."
+    else:
+        news = (f"{row.negative_news} of {row.headlines} recent headlines mention crime or "
+                f"violence, {row.positive_news} mention patrols or community action.")
+    keywords = ", ".join((record.get("vibe_keywords") or [])[:6])
+    hoodmaps = f" HoodMaps describes the area as: {keywords}." if keywords else ""
+    ratio = record.get("emoji4_ratio")
+    if ratio is None:
+        return f"{news}{hoodmaps} There are no emoji reactions for this area yet."
+    return f"{news}{hoodmaps} {ratio:.0%} of emoji reactions here mark places as safe."
+
+
+def _character(record) -> str:
+    keywords = record.get("vibe_keywords") or []
+    if not keywords:
+        return "No HoodMaps description is available for this neighbourhood."
+    return f"Local vibe according to HoodMaps: {', '.join(keywords)}."
+
+
+def local_assessments(records, scores: pd.DataFrame = None) -> list:
+    """
+    SafetyAssessments for `records` without the model: score and top
+    places from score_records, short template text for the prose fields.
+    """
+    if scores is None:
+        scores = score_records(records)
+    return [
+        SafetyAssessment(
+            neighbourhood=record["neighbourhood"],
+            safety_score=float(row.score),
+            top_safe_places=top_places(record),
+            safety_overview=_overview(row, record),
+            social_character=_character(record),
+        )
+        for record, row in zip(records, scores.itertuples(index=False))
+    ]
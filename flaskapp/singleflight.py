@@ -0,0 +1,70 @@
+# singleflight.py
+#
+# Request coalescing: while a computation for a key is running, further
+# callers with the same key wait for it and share its result (or its
+# exception) instead of starting their own.
+
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Thread-safe single-flight group.
+
+        flights = SingleFlight()
+        result, shared = flights.do("paris", assess_city, "paris")
+
+    Only in-flight calls are shared; once a call finishes, the next caller
+    starts a new one (caching is left to the caller).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Runs ``fn(*args, **kwargs)`` unless a call for `key` is already in
+        flight, in which case it waits for that one. Returns
+        ``(result, shared)``; an exception raised by `fn` is raised in every
+        caller waiting on it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.waiters > 0
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
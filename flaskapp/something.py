@@ -1,111 +1,46 @@
 import json
-import pandas as pd
-import re
+import hashlib
+import math
 import os
-from openai import OpenAI
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
-
-
-def generate_neighbourhood_safety_json(articles, emoji_table):
-    """
-    Generates a neighbourhood‑level safety & vibe assessment JSON using
-    NVIDIA's LLaMA‑3.3 model via its OpenAI‑compatible endpoint.
-
-    Parameters
-    ----------
-    articles : list[dict]
-        Each dict must contain:
-        {
-            "neighbourhood": str,
-            "description": str,   # HoodMaps‑style keywords (space‑separated)
-            "news": list[str]     # list of headline strings
-        }
-
-    emoji_table : pandas.DataFrame
-        Must have columns:
-        ["neighbourhood", "place", "emoji_1", "emoji_2", "emoji_3", "emoji_4"]
-        (additional emoji_N columns are ignored).
-
-    The function reads the NVIDIA API key from "../.env" under
-    key name OPENAI_API_KEY, keeps the system prompt *exactly*
-    as supplied, calls the model, and returns a parsed JSON object.
-    """
-
-    # ------------------------------------------------------------------
-    # 1.  Load API key from ../.env
-    # ------------------------------------------------------------------
-    load_dotenv(dotenv_path="../.env")
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in ../.env")
-
-    # Init OpenAI‑compatible client for NVIDIA endpoint
-    client = OpenAI(
-        base_url="https://integrate.api.nvidia.com/v1",
-        api_key=api_key,
-    )
-
-    # ------------------------------------------------------------------
-    # 2.  Helper functions for emoji stats
-    # ------------------------------------------------------------------
-    def compute_emoji4_ratio(df: pd.DataFrame) -> pd.Series:
-        df = df.copy()
-        df["total"] = df.filter(like="emoji_").sum(axis=1)
-        df["ratio"] = df["emoji_4"] / df["total"].clip(lower=1)
-        return (
-            df.groupby("neighbourhood")
-              .apply(lambda g: (g["ratio"] * g["total"]).sum() / g["total"].sum())
-        )
-
-    def top_safe_places(df: pd.DataFrame, n: int = 3):
-        return (
-            df.sort_values("emoji_4", ascending=False)
-              .groupby("neighbourhood")
-              .head(n)
-              .groupby("neighbourhood")["place"]
-              .apply(list)
-              .to_dict()
-        )
-
-    # ------------------------------------------------------------------
-    # 3.  Derive vibe_keywords automatically from description strings
-    # ------------------------------------------------------------------
-    vibe_keywords = {
-        row["neighbourhood"]: row["description"].lower().split()
-        for row in articles
-    }
-
-    # ------------------------------------------------------------------
-    # 4.  Build structured input for the model
-    # ------------------------------------------------------------------
-    emoji_ratio = compute_emoji4_ratio(emoji_table)
-    top_places  = top_safe_places(emoji_table)
-
-    records = []
-    for row in articles:
-        nbh = row["neighbourhood"]
-        records.append({
-            "neighbourhood": nbh,
-            "emoji4_ratio": round(float(emoji_ratio.get(nbh, 0)), 4),
-            "vibe_keywords": vibe_keywords.get(nbh, []),
-            "news": row["news"],
-            "top_places_counts": [
-                {
-                    "place": p,
-                    "emoji4": int(
-                        emoji_table.query("neighbourhood == @nbh and place == @p")["emoji_4"].iloc[0]
-                    ),
-                }
-                for p in top_places.get(nbh, [])
-            ],
-        })
-
-    formatted_input = json.dumps(records, ensure_ascii=False, indent=2)
-
-    # ------------------------------------------------------------------
-    # 5.  SYSTEM PROMPT (kept *exactly* as provided)
-    # ------------------------------------------------------------------
-    SYSTEM_PROMPT = """Thought for 7 seconds
+from cache import LRUCache, SQLiteCache
+from emoji_stats import compute_emoji4_ratio, top_places_with_counts
+from llm_batching import run_chunks, split_records
+from llm_gateway import LLMGateway
+from llm_output import parse_assessments, validate_assessment
+from metrics import record_llm_usage, stage
+from scoring import local_assessments
+from warmup import throttle
+
+
+# ----------------------------------------------------------------------
+# Model settings
+# ----------------------------------------------------------------------
+# Any OpenAI-compatible endpoint, e.g. a local stub for offline benchmarks
+LLM_BASE_URL = os.getenv("BIBBLE_LLM_BASE_URL", "https://integrate.api.nvidia.com/v1")
+LLM_MODEL = "nvidia/llama-3.3-nemotron-super-49b-v1"
+LLM_TEMPERATURE = 0.4
+LLM_MAX_TOKENS = 1000
+# Seconds per request, and retries (with exponential backoff) per request
+LLM_TIMEOUT = float(os.getenv("BIBBLE_LLM_TIMEOUT", 60))
+LLM_MAX_RETRIES = int(os.getenv("BIBBLE_LLM_RETRIES", 2))
+# Completions in flight at once from one worker
+LLM_CONCURRENCY = int(os.getenv("BIBBLE_LLM_CONCURRENCY", 8))
+# Send a prompt_cache_key so the provider reuses the cached system prompt
+LLM_PROMPT_CACHE = os.getenv("BIBBLE_LLM_PROMPT_CACHE", "0") == "1"
+# Extra requests for neighbourhoods whose assessment came back invalid
+REASK_ATTEMPTS = 1
+# Take "Safety Score" and "Top 3 Safe Places" from the local engine
+# (scoring.py) and only the prose fields from the model. Either way,
+# neighbourhoods the model fails on get the local assessment
+LOCAL_SCORES = os.getenv("BIBBLE_LOCAL_SCORES", "0") == "1"
+
+# ----------------------------------------------------------------------
+# SYSTEM PROMPT (kept *exactly* as provided)
+# ----------------------------------------------------------------------
+SYSTEM_PROMPT = """Thought for 7 seconds
 
 
 Purpose: Evaluate neighbourhood safety and social atmosphere for digital nomads using crowdsourced data, place‑level emoji reactions, HoodMaps descriptors, and local news.
@@ -183,27 +118,363 @@ Rules:
 • Provide no extra commentary outside the JSON.
 ."""
 
+
+# ----------------------------------------------------------------------
+# Cache of final model answers
+# ----------------------------------------------------------------------
+# Identical requests (same model, prompt, temperature and records) get the
+# stored answer instead of a new chat completion. Set BIBBLE_LLM_CACHE to a
+# file path to share the cache between workers through SQLite.
+LLM_CACHE_TTL = float(os.getenv("BIBBLE_LLM_CACHE_TTL", 6 * 3600))
+LLM_CACHE_SIZE = int(os.getenv("BIBBLE_LLM_CACHE_SIZE", "512"))
+
+
+def _response_cache_from_env():
+    path = os.getenv("BIBBLE_LLM_CACHE")
+    if path:
+        return SQLiteCache(path, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+    return LRUCache(max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+
+
+RESPONSE_CACHE = _response_cache_from_env()  # set to None to disable
+
+
+# ----------------------------------------------------------------------
+# Per-neighbourhood assessments (incremental refresh)
+# ----------------------------------------------------------------------
+# Every neighbourhood's assessment is stored under a hash of its record
+# (description keywords, news, emoji stats). A refresh only sends the
+# neighbourhoods whose record changed to the model and reuses the rest.
+# BIBBLE_ASSESSMENT_CACHE works like BIBBLE_LLM_CACHE.
+ASSESSMENT_CACHE_TTL = float(os.getenv("BIBBLE_ASSESSMENT_CACHE_TTL", 7 * 24 * 3600))
+ASSESSMENT_CACHE_SIZE = int(os.getenv("BIBBLE_ASSESSMENT_CACHE_SIZE", "4096"))
+
+
+def _assessment_cache_from_env():
+    path = os.getenv("BIBBLE_ASSESSMENT_CACHE")
+    if path:
+        return SQLiteCache(path, max_entries=ASSESSMENT_CACHE_SIZE, ttl=ASSESSMENT_CACHE_TTL)
+    return LRUCache(max_entries=ASSESSMENT_CACHE_SIZE, ttl=ASSESSMENT_CACHE_TTL)
+
+
+ASSESSMENT_CACHE = _assessment_cache_from_env()  # set to None to disable
+
+
+def request_fingerprint(model: str, system_prompt: str, temperature: float,
+                        records, max_tokens: int = None) -> str:
+    """Stable SHA-256 over everything that determines the model's answer."""
+    canonical = json.dumps(
+        {
+            "model": model,
+            "system": system_prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "records": records,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _api_key():
+    """Loads the NVIDIA API key from ../.env (once per process)."""
+    load_dotenv(dotenv_path="../.env")
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in ../.env")
+    return api_key
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def llm_gateway() -> LLMGateway:
+    """The worker's LLMGateway for the NVIDIA endpoint (created on first use)."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    LLM_BASE_URL, _api_key(), SYSTEM_PROMPT, LLM_MODEL,
+                    timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                    max_concurrency=LLM_CONCURRENCY, prompt_cache=LLM_PROMPT_CACHE,
+                )
+    return _gateway
+
+
+def build_safety_records(articles, emoji_table, emoji_ratio=None):
+    """
+    Builds the per-neighbourhood records sent to the model (see
+    ``generate_neighbourhood_safety_json`` for the parameters).
+    """
     # ------------------------------------------------------------------
-    # 6.  LLM call
+    # 1.  Derive vibe_keywords automatically from description strings
     # ------------------------------------------------------------------
-    response = client.chat.completions.create(
-        model="nvidia/llama-3.3-nemotron-super-49b-v1",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user",   "content": formatted_input}
-        ],
-        max_tokens=1000,
-        temperature=0.4,
-    )
+    vibe_keywords = {
+        row["neighbourhood"]: row["description"].lower().split()
+        for row in articles
+    }
+
+    # ------------------------------------------------------------------
+    # 2.  Build structured input for the model
+    # ------------------------------------------------------------------
+    if emoji_ratio is None:
+        emoji_ratio = compute_emoji4_ratio(emoji_table)
+    top_places  = top_places_with_counts(emoji_table)
+
+    records = []
+    for row in articles:
+        nbh = row["neighbourhood"]
+        ratio = emoji_ratio.get(nbh)
+        records.append({
+            "neighbourhood": nbh,
+            # None: no reactions for this neighbourhood (not "nobody feels safe")
+            "emoji4_ratio": None if ratio is None or math.isnan(ratio) else round(float(ratio), 4),
+            "vibe_keywords": vibe_keywords.get(nbh, []),
+            "news": row["news"],
+            "top_places_counts": top_places.get(nbh, []),
+        })
+    return records
+
+
+# Built once: the multi-kilobyte prompt is neither copied nor re-hashed per call
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+SYSTEM_PROMPT_SHA = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+
+
+def _user_content(records):
+    return json.dumps(records, ensure_ascii=False, indent=2)
+
+
+def _chat_messages(records):
+    return [SYSTEM_MESSAGE, {"role": "user", "content": _user_content(records)}]
+
+
+def _cache_key(records):
+    return request_fingerprint(LLM_MODEL, SYSTEM_PROMPT_SHA, LLM_TEMPERATURE, records, LLM_MAX_TOKENS)
+
+
+def record_fingerprint(record) -> str:
+    """Content hash of one neighbourhood's record (and the model settings)."""
+    return "nbh:" + request_fingerprint(LLM_MODEL, SYSTEM_PROMPT_SHA, LLM_TEMPERATURE,
+                                        record, LLM_MAX_TOKENS)
 
-    raw_text = response.choices[0].message.content
+
+def _reuse_assessments(records) -> list:
+    """
+    The stored assessment of every record whose content hash is unchanged,
+    None for the ones that have to be (re)computed.
+    """
+    if ASSESSMENT_CACHE is None:
+        return [None] * len(records)
+    assessments = []
+    for record in records:
+        stored = ASSESSMENT_CACHE.get(record_fingerprint(record))
+        try:
+            assessments.append(validate_assessment(stored) if stored is not None else None)
+        except ValueError:
+            assessments.append(None)
+    reused = sum(a is not None for a in assessments)
+    if reused:
+        print(f"♻️ Reusing {reused} of {len(records)} neighbourhood assessment(s)")
+    return assessments
+
+
+def _store_assessments(records, assessments):
+    """Stores the model's assessments (None entries are skipped)."""
+    if ASSESSMENT_CACHE is None:
+        return
+    for record, assessment in zip(records, assessments):
+        if assessment is not None:
+            ASSESSMENT_CACHE.set(record_fingerprint(record), assessment.to_dict())
+
+
+def generate_neighbourhood_safety_json(articles, emoji_table, emoji_ratio=None, fast=False):
+    """
+    Generates a neighbourhood‑level safety & vibe assessment JSON using
+    NVIDIA's LLaMA‑3.3 model via its OpenAI‑compatible endpoint.
+
+    Parameters
+    ----------
+    articles : list[dict]
+        Each dict must contain:
+        {
+            "neighbourhood": str,
+            "description": str,   # HoodMaps‑style keywords (space‑separated)
+            "news": list[str]     # list of headline strings
+        }
+
+    emoji_table : pandas.DataFrame
+        Must have columns:
+        ["neighbourhood", "place", "emoji_1", "emoji_2", "emoji_3", "emoji_4"]
+        (additional emoji_N columns are ignored). Typically a city slice
+        from EmojiStore or EmojiTable (categorical keys, uint16/uint32
+        counts); it is read in place, never copied.
+
+    emoji_ratio : pandas.Series, optional
+        Pre-computed Emoji 4 ratio per neighbourhood (e.g. from
+        EmojiStore.emoji4_ratios); computed from `emoji_table` if omitted.
+
+    fast : bool, optional
+        Skip the model: every field comes from the local scoring engine
+        (scoring.py), in milliseconds.
+
+    The function reads the NVIDIA API key from "../.env" under
+    key name OPENAI_API_KEY, keeps the system prompt *exactly*
+    as supplied, calls the model, and returns a parsed JSON object:
+    one dict per neighbourhood in the prompt's output schema, in the order
+    of `articles`, validated by llm_output.py. Neighbourhoods whose object
+    is missing or invalid are re-asked on their own (REASK_ATTEMPTS).
+    Repeated inputs are answered from RESPONSE_CACHE without a model call.
+    Cities with many neighbourhoods are sent in parallel chunks (see
+    llm_batching.py) whose answers are merged in the original order.
+    Neighbourhoods whose record is unchanged since an earlier call reuse
+    their stored assessment (ASSESSMENT_CACHE); only the others reach the
+    model.
+    """
+    with stage("emoji_stats"):
+        records = build_safety_records(articles, emoji_table, emoji_ratio)
+    if fast:
+        with stage("local_scoring"):
+            return [a.to_dict() for a in local_assessments(records)]
+
+    assessments = _reuse_assessments(records)
+    changed = [r for r, a in zip(records, assessments) if a is None]
+
+    # Large cities are split into token-budgeted chunks that run in parallel
+    reask_attempts = REASK_ATTEMPTS
+    if changed:
+        try:
+            fresh = iter(run_chunks(split_records(changed), _assess_chunk))
+            assessments = [a if a is not None else next(fresh) for a in assessments]
+        except RuntimeError as e:
+            print(f"⚠️ LLM assessment failed, answering with local scores: {e}")
+            reask_attempts = 0  # the model is down; don't ask again
 
     # ------------------------------------------------------------------
-    # 7.  Extract valid JSON block
+    # Re-ask the model only for neighbourhoods whose answer was invalid
     # ------------------------------------------------------------------
-    # raw = re.sub(r"^```(?:json)?|```$", "", raw_text.strip(), flags=re.IGNORECASE | re.MULTILINE)
-    # match = re.search(r"\[\s*{.*?}\s*]", raw, flags=re.DOTALL)
-    # if not match:
-    #     raise ValueError(f"No valid JSON block found. Raw model output:\n{raw_text}")
+    for _ in range(reask_attempts):
+        missing = [r for r, a in zip(records, assessments) if a is None]
+        if not missing:
+            break
+        print(f"🔁 Re-asking for {len(missing)} neighbourhood(s): "
+              f"{[r['neighbourhood'] for r in missing]}")
+        try:
+            retried = iter(run_chunks(split_records(missing), _assess_chunk))
+        except RuntimeError as e:
+            print(f"⚠️ Re-ask failed: {e}")
+            break
+        assessments = [a if a is not None else next(retried) for a in assessments]
+
+    _store_assessments(records, assessments)
+    if LOCAL_SCORES or None in assessments:
+        with stage("local_scoring"):
+            assessments = apply_local_scores(records, assessments, override=LOCAL_SCORES)
+    for r, a in zip(records, assessments):
+        if a is None:
+            print(f"⚠️ No valid assessment for {r['neighbourhood']}")
+    return [a.to_dict() for a in assessments if a is not None]
+
+
+def apply_local_scores(records, assessments, override: bool = True) -> list:
+    """
+    Fills neighbourhoods without a model assessment (None) with the local
+    assessment and, with `override`, replaces the model's Safety Score and
+    Top 3 Safe Places with the local engine's (deterministic) ones.
+    """
+    merged = []
+    for local, assessment in zip(local_assessments(records), assessments):
+        if assessment is None:
+            print(f"⚠️ No valid model assessment for {local.neighbourhood}, using local scores")
+            merged.append(local)
+            continue
+        if not override:
+            merged.append(assessment)
+            continue
+        assessment.safety_score = local.safety_score
+        assessment.top_safe_places = local.top_safe_places
+        merged.append(assessment)
+    return merged
+
+
+def _complete(records):
+    """
+    One chat completion for `records`, answered from RESPONSE_CACHE for
+    repeated inputs. Returns the raw model text.
+    """
+    cache_key = _cache_key(records)
+    if RESPONSE_CACHE is not None:
+        cached = RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+    throttle("llm")
+    with stage("llm_call"):
+        response = llm_gateway().complete(
+            _user_content(records),
+            max_tokens=LLM_MAX_TOKENS,
+            temperature=LLM_TEMPERATURE,
+        )
+    record_llm_usage(response.usage)
+
+    raw_text = response.choices[0].message.content
 
+    if RESPONSE_CACHE is not None and raw_text:
+        RESPONSE_CACHE.set(cache_key, raw_text)
     return raw_text
+
+
+def _assess_chunk(records):
+    """
+    Validated assessments for one chunk of records, in record order (None
+    where the model's object was missing or invalid). An answer that is
+    not fully valid is dropped from the cache, so it is not served again.
+    """
+    raw_text = _complete(records)
+    names = [r["neighbourhood"] for r in records]
+    try:
+        valid = parse_assessments(raw_text, names)
+    except ValueError:
+        valid = {}
+    if len(valid) < len(names) and RESPONSE_CACHE is not None:
+        RESPONSE_CACHE.delete(_cache_key(records))
+    if not valid:
+        raise ValueError(f"No valid assessment in model output:\n{raw_text}")
+    return [valid.get(name) for name in names]
+
+
+def stream_neighbourhood_safety_json(articles, emoji_table, emoji_ratio=None):
+    """
+    Same as ``generate_neighbourhood_safety_json`` but yields the model's
+    answer in text chunks as they are generated (``stream=True``). A cached
+    answer is yielded as a single chunk.
+    """
+    with stage("emoji_stats"):
+        records = build_safety_records(articles, emoji_table, emoji_ratio)
+
+    cache_key = _cache_key(records)
+    if RESPONSE_CACHE is not None:
+        cached = RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    throttle("llm")
+    parts = []
+    # Timed from the request to the last delta, as in _complete
+    with stage("llm_call"):
+        for delta in llm_gateway().stream(_user_content(records),
+                                          on_usage=record_llm_usage,
+                                          max_tokens=LLM_MAX_TOKENS,
+                                          temperature=LLM_TEMPERATURE):
+            parts.append(delta)
+            yield delta
+
+    raw_text = "".join(parts)
+    if RESPONSE_CACHE is not None and raw_text:
+        RESPONSE_CACHE.set(cache_key, raw_text)
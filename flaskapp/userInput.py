@@ -1,13 +1,27 @@
 
+import os
 import pandas as pd
+import numpy as np
 import random
 from faker import Faker
 
+# Rows per DataFrame yielded by iter_synthetic_chunks
+CHUNK_ROWS = 1_000_000
+# Faker names drawn once per run; larger tables reuse them with a number appended
+CITY_POOL = 500
+STREET_POOL = 500
+COMPANY_POOL = 1000
+NEIGHBORHOOD_KINDS = ['District', 'Quarter', 'Neighborhood', 'Zone']
+PLACE_KINDS = ['Museum', 'Park', 'Square', 'Palace', 'Center', 'Gallery']
+
+
 def generate_synthetic_tourist_data(
     num_cities: int = 50,
     neighborhoods_per_city: int = 10,
     places_per_neighborhood: int = 5,
-    emoji_types: int = 5
+    emoji_types: int = 5,
+    vectorized: bool = False,
+    seed: int = 42,
 ) -> pd.DataFrame:
     """
     Generates a table of synthetic tourist data with realistic-looking names using Faker.
@@ -16,7 +30,16 @@ def generate_synthetic_tourist_data(
     - neighborhoods_per_city: number of neighborhoods per city
     - places_per_neighborhood: number of famous places per neighborhood
     - emoji_types: number of distinct emoji columns (Emoji 1 … Emoji N)
+    - vectorized: build the table with NumPy instead (see iter_synthetic_chunks);
+      much faster, with skewed per-place popularity, but different values
     """
+    if vectorized:
+        return pd.concat(
+            iter_synthetic_chunks(num_cities, neighborhoods_per_city,
+                                  places_per_neighborhood, emoji_types, seed=seed),
+            ignore_index=True,
+        )
+
     faker = Faker()
     Faker.seed(42)
     random.seed(42)
@@ -53,6 +76,143 @@ def generate_synthetic_tourist_data(
     df = pd.DataFrame(data)
     return df
 
+
+# ----------------------------------------------------------------------
+# Vectorized generator (load / scale testing)
+# ----------------------------------------------------------------------
+def _name_pool(draw, base_size: int, needed: int, kinds, rng) -> list:
+    """
+    `needed` unique names: `base_size` Faker draws with a random kind
+    appended, then the same names again numbered 2, 3, ... if more are needed.
+    """
+    base = [f"{draw()} {kinds[k]}" if kinds else draw()
+            for k in rng.integers(0, max(1, len(kinds)), min(base_size, needed))]
+    return [
+        base[i % len(base)] if i < len(base) else f"{base[i % len(base)]} {i // len(base) + 1}"
+        for i in range(needed)
+    ]
+
+
+def iter_synthetic_chunks(
+    num_cities: int,
+    neighborhoods_per_city: int = 10,
+    places_per_neighborhood: int = 5,
+    emoji_types: int = 5,
+    seed: int = 42,
+    chunk_rows: int = CHUNK_ROWS,
+    mean_reactions: float = 250.0,
+):
+    """
+    Yields the synthetic table in DataFrames of at most `chunk_rows` rows,
+    so memory stays bounded whatever the total size
+    (num_cities * neighborhoods_per_city * places_per_neighborhood rows).
+
+    Names come from small pre-sampled Faker pools and are stored as
+    categoricals (one shared set of categories per column). Emoji counts are
+    drawn in bulk: every place gets a log-normal popularity (a few places
+    collect most reactions, mean `mean_reactions`), split over the emoji
+    columns by Poisson draws, with emoji_4 ("safe") tilted per neighbourhood.
+
+    Output is deterministic for a given `seed` and `chunk_rows`.
+    """
+    faker = Faker()
+    faker.seed_instance(seed)
+    rng = np.random.default_rng(seed)
+
+    cities = pd.CategoricalDtype(_name_pool(faker.unique.city, CITY_POOL, num_cities, [], rng))
+    neighborhoods = pd.CategoricalDtype(_name_pool(
+        faker.unique.street_name, STREET_POOL, max(STREET_POOL, neighborhoods_per_city),
+        NEIGHBORHOOD_KINDS, rng))
+    places = pd.CategoricalDtype(_name_pool(
+        faker.unique.company, COMPANY_POOL, max(COMPANY_POOL, places_per_neighborhood),
+        PLACE_KINDS, rng))
+    n_nbh_names = len(neighborhoods.categories)
+    n_place_names = len(places.categories)
+
+    # Per-city and per-neighbourhood draws are small; make them up front
+    total_nbh = num_cities * neighborhoods_per_city
+    city_offset = rng.integers(0, n_nbh_names, num_cities)
+    nbh_offset = rng.integers(0, n_place_names, total_nbh)
+    nbh_safety = rng.beta(2.0, 2.0, total_nbh)
+
+    sigma = 1.0
+    mu = np.log(mean_reactions) - sigma ** 2 / 2
+    emoji_cols = [f"emoji_{e}" for e in range(1, emoji_types + 1)]
+    safe_col = min(3, emoji_types - 1)   # emoji_4
+
+    total_rows = total_nbh * places_per_neighborhood
+    for start in range(0, total_rows, chunk_rows):
+        chunk_rng = np.random.default_rng([seed, start])
+        row = np.arange(start, min(start + chunk_rows, total_rows), dtype=np.int64)
+        nbh = row // places_per_neighborhood              # global neighbourhood index
+        city = nbh // neighborhoods_per_city
+        nbh_in_city = nbh % neighborhoods_per_city
+        place_in_nbh = row % places_per_neighborhood
+
+        # Consecutive pool entries from a random offset keep names unique
+        # within their parent (pool sizes >= the per-parent counts)
+        frame = pd.DataFrame({
+            "city": pd.Categorical.from_codes(city, dtype=cities),
+            "neighbourhood": pd.Categorical.from_codes(
+                (city_offset[city] + nbh_in_city) % n_nbh_names, dtype=neighborhoods),
+            "place": pd.Categorical.from_codes(
+                (nbh_offset[nbh] + place_in_nbh) % n_place_names, dtype=places),
+        })
+
+        popularity = chunk_rng.lognormal(mu, sigma, len(row)).astype(np.float32)
+        weights = np.ones((len(row), emoji_types), dtype=np.float32)
+        weights[:, safe_col] = 0.5 + 2.0 * nbh_safety[nbh]
+        weights /= weights.sum(axis=1, keepdims=True)
+        expected = popularity[:, None] * weights
+        counts = _poisson(chunk_rng, expected)
+        for i, col in enumerate(emoji_cols):
+            frame[col] = counts[:, i]
+        yield frame
+
+
+def _poisson(rng, lam):
+    """
+    Poisson draws for a float32 array of means, as int32. Means of 10 and up
+    use the normal approximation, which is several times cheaper than
+    rng.poisson for the large means of popular places.
+    """
+    counts = np.rint(lam + np.sqrt(lam) * rng.standard_normal(lam.shape, dtype=np.float32))
+    small = lam < 10
+    counts[small] = rng.poisson(lam[small])
+    np.maximum(counts, 0, out=counts)
+    return counts.astype(np.int32)
+
+
+def write_synthetic_data(path: str, num_cities: int, **kwargs) -> int:
+    """
+    Streams ``iter_synthetic_chunks(num_cities, **kwargs)`` to a Parquet
+    (.parquet) or CSV (any other extension) file, one chunk at a time.
+    Returns the number of rows written.
+    """
+    rows = 0
+    if os.path.splitext(path)[1].lower() == ".parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for frame in iter_synthetic_chunks(num_cities, **kwargs):
+                table = pa.Table.from_pandas(frame, preserve_index=False,
+                                             schema=writer.schema if writer else None)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows += len(frame)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+    for frame in iter_synthetic_chunks(num_cities, **kwargs):
+        frame.to_csv(path, mode="a" if rows else "w", header=not rows, index=False)
+        rows += len(frame)
+    return rows
+
 # if __name__ == "__main__":
 #     df = generate_synthetic_tourist_data()
 #     print(df.head())
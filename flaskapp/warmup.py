@@ -0,0 +1,208 @@
+# warmup.py
+#
+# Background precomputation of popular cities.
+#
+# A scheduler thread enqueues every hot city each `interval` seconds; one
+# worker thread takes jobs off the local queue and runs the full pipeline.
+# Every upstream request of a warm-up job (each HoodMaps page, RSS feed and
+# LLM chunk) first takes a token from its source's bucket (see throttle),
+# so a refresh is spread out instead of firing all at once. It still goes
+# to the same hosts and LLM as live requests.
+# Results are kept in a cache backend and served by /process_city.
+
+import contextvars
+import os
+import queue
+import threading
+import time
+
+from cache import LRUCache, SQLiteCache
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, up to `burst` saved."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0, stop_event=None):
+        """Waits until `n` tokens are available and takes them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # Large requests may overdraw a full bucket instead of waiting forever
+                if self._tokens >= min(n, self.burst):
+                    self._tokens -= n
+                    return True
+                wait = (min(n, self.burst) - self._tokens) / self.rate
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+# Warm-up requests per minute, per upstream source
+WARMUP_RATE_LIMITS = {
+    "hoodmaps": 6,
+    "news": 60,
+    "llm": 2,
+}
+
+
+# (buckets, stop_event) of the warm-up job running in this context, if any;
+# carried into worker threads by metrics.submit
+_BUDGET = contextvars.ContextVar("warmup_budget", default=None)
+
+
+class WarmupStopped(RuntimeError):
+    """Raised by throttle() in a warm-up job once the scheduler is stopping."""
+
+
+def throttle(source: str):
+    """
+    Called before every upstream request to `source` ("hoodmaps", "news",
+    "llm"): waits for a token when the request is made for a warm-up job,
+    returns at once for live requests. Raises WarmupStopped instead of
+    letting the request through once the warm-up is stopping.
+    """
+    budget = _BUDGET.get()
+    if budget is None:
+        return
+    buckets, stop_event = budget
+    bucket = buckets.get(source)
+    if bucket is not None and not bucket.acquire(1, stop_event=stop_event):
+        raise WarmupStopped(f"warm-up stopped before the {source} request")
+
+
+class WarmupScheduler:
+    """
+    Periodically recomputes `compute(city)` for a list of hot cities.
+
+    - cities: cities to keep warm (lower-case)
+    - compute: the pipeline, e.g. pipeline.assess_city_warmup (never a run
+      that live requests can join: they would wait on the warm-up budget)
+    - interval: seconds between two refreshes of the same city
+    - max_stale: results older than this are not served at all
+    - rate_limits: warm-up requests per minute per source
+    - store: cache backend for the results (defaults to an in-process LRU)
+    """
+
+    def __init__(self, cities, compute, interval: float = 900.0, max_stale: float = 6 * 3600,
+                 rate_limits: dict = None, store=None):
+        self.cities = [c.strip().lower() for c in cities if c.strip()]
+        self.compute = compute
+        self.interval = interval
+        self.max_stale = max_stale
+        self.store = store if store is not None else LRUCache(max_entries=max(64, 2 * len(self.cities)))
+        limits = dict(WARMUP_RATE_LIMITS, **(rate_limits or {}))
+        self.buckets = {source: TokenBucket(per_minute / 60.0, burst=per_minute / 6.0 or 1)
+                        for source, per_minute in limits.items()}
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def from_env(cls, compute):
+        """
+        Configured from BIBBLE_HOT_CITIES (comma-separated),
+        BIBBLE_WARMUP_INTERVAL, BIBBLE_WARMUP_MAX_STALE and BIBBLE_WARMUP_STORE
+        (SQLite file to keep results across restarts).
+        """
+        cities = os.getenv("BIBBLE_HOT_CITIES", "").split(",")
+        path = os.getenv("BIBBLE_WARMUP_STORE")
+        return cls(
+            cities,
+            compute,
+            interval=float(os.getenv("BIBBLE_WARMUP_INTERVAL", 900)),
+            max_stale=float(os.getenv("BIBBLE_WARMUP_MAX_STALE", 6 * 3600)),
+            store=SQLiteCache(path) if path else None,
+        )
+
+    # ------------------------------------------------------------------
+    # serving
+    # ------------------------------------------------------------------
+    def get(self, city: str):
+        """
+        Returns ``(result, is_stale)`` for a precomputed city, or
+        ``(None, False)``. A stale result (older than `interval`) is still
+        returned while younger than `max_stale`, and a refresh is queued.
+        """
+        city = city.strip().lower()
+        entry = self.store.get_entry(city)
+        if entry is None:
+            return None, False
+        age = time.time() - entry.stored_at
+        if age > self.max_stale:
+            self.refresh(city)
+            return None, False
+        stale = age > self.interval
+        if stale:
+            self.refresh(city)
+        return entry.value, stale
+
+    def refresh(self, city: str):
+        """Queues a recompute of `city` (no-op if one is already queued)."""
+        city = city.strip().lower()
+        with self._queued_lock:
+            if city in self._queued:
+                return
+            self._queued.add(city)
+        self._queue.put(city)
+
+    # ------------------------------------------------------------------
+    # background threads
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._threads:
+            return self
+        for target, name in ((self._schedule_loop, "warmup-scheduler"),
+                             (self._work_loop, "warmup-worker")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+
+    def _schedule_loop(self):
+        while not self._stop.is_set():
+            for city in self.cities:
+                entry = self.store.get_entry(city)
+                if entry is None or time.time() - entry.stored_at >= self.interval:
+                    self.refresh(city)
+            self._stop.wait(min(60.0, self.interval))
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            city = self._queue.get()
+            if city is None:
+                return
+            token = _BUDGET.set((self.buckets, self._stop))
+            try:
+                started = time.perf_counter()
+                result = self.compute(city)
+                if self._stop.is_set():
+                    # Some upstream calls were skipped; don't cache a partial result
+                    return
+                if result is not None:
+                    self.store.set(city, result)
+                print(f"🔥 Warmed up {city} in {time.perf_counter() - started:.1f}s")
+            except WarmupStopped:
+                return
+            except Exception as e:
+                print(f"⚠️ Warm-up of {city} failed: {e}")
+            finally:
+                _BUDGET.reset(token)
+                with self._queued_lock:
+                    self._queued.discard(city)